@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+"""Benchmarks of the client hot paths.
+
+The benchmarks run against an in-process FakeRexsterServer serving a
+generated graph, each one in a subprocess of its own so its peak memory
+can be measured. For every benchmark it reports the number of HTTP
+requests per operation, the wall time per operation and the peak
+resident memory of the client process:
+
+    python bench_rexster.py --vertices 10000 --edges 50000 --latency 0.001
+    python bench_rexster.py getVertices getEdges
+"""
+
+import argparse
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import simplejson
+
+from rexster import RexsterIndexableGraph, RexsterServer, RequestStats
+from rexster.testing import FakeRexsterServer
+
+GRAPH = 'benchgraph'
+SAMPLE = 100
+
+
+def benchGetVertices(graph, ids):
+    for vertex in graph.getVertices():
+        pass
+    return 1
+
+
+def benchGetEdges(graph, ids):
+    for edge in graph.getEdges():
+        pass
+    return 1
+
+
+def benchGetBothEdges(graph, ids):
+    for _id in ids:
+        for edge in graph.getVertex(_id, lazy=True).getBothEdges():
+            pass
+    return len(ids)
+
+
+def benchIndexGet(graph, ids):
+    index = graph.getIndex('group')
+    for group in range(10):
+        for vertex in index.get('group', str(group)):
+            pass
+    return 10
+
+
+def benchAddVertexEdge(graph, ids):
+    vertices = [graph.addVertex() for i in range(SAMPLE)]
+    for outV, inV in zip(vertices, vertices[1:]):
+        graph.addEdge(outV, inV, 'bench')
+    return 2 * SAMPLE - 1
+
+
+def benchBatchIngest(graph, ids):
+    with graph.batch() as batch:
+        vertices = [batch.addVertex() for i in range(SAMPLE)]
+        for outV, inV in zip(vertices, vertices[1:]):
+            batch.addEdge(outV, inV, 'bench')
+    return 2 * SAMPLE - 1
+
+
+def benchGremlinExecute(graph, ids):
+    for i in range(10):
+        graph.execute('vertices', ids)
+    return 10
+
+
+BENCHMARKS = [
+    ('getVertices', benchGetVertices),
+    ('getEdges', benchGetEdges),
+    ('getBothEdges', benchGetBothEdges),
+    ('indexGet', benchIndexGet),
+    ('addVertexEdge', benchAddVertexEdge),
+    ('batchIngest', benchBatchIngest),
+    ('gremlinExecute', benchGremlinExecute),
+]
+
+
+def runBenchmark(name, url, vertices):
+    """Runs a benchmark in the current process
+
+    @returns A dict with the measures"""
+    server = RexsterServer(url)
+    stats = RequestStats()
+    server.connection.addListener(stats)
+    graph = RexsterIndexableGraph(server, GRAPH)
+    ids = random.Random(0).sample(range(1, vertices + 1),
+                                  min(SAMPLE, vertices))
+    started = time.time()
+    operations = dict(BENCHMARKS)[name](graph, ids)
+    elapsed = time.time() - started
+    return {'name': name,
+            'operations': operations,
+            'requestsPerOp': float(stats.total()) / operations,
+            'secondsPerOp': elapsed / operations,
+            'seconds': elapsed,
+            'peakMemoryKB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('benchmarks', nargs='*',
+                        help='benchmarks to run, all by default: %s'
+                        % ', '.join(name for name, func in BENCHMARKS))
+    parser.add_argument('--vertices', type=int, default=10000)
+    parser.add_argument('--edges', type=int, default=50000)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds waited by the server per request')
+    parser.add_argument('--child', nargs=2, metavar=('NAME', 'URL'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(simplejson.dumps(runBenchmark(args.child[0], args.child[1],
+                                            args.vertices)))
+        return
+
+    fake = FakeRexsterServer(graphs=(), latency=args.latency)
+    graph = fake.generate(GRAPH, args.vertices, args.edges)
+    graph.createIndex('group', 'vertex')
+    for _id, vertex in graph.vertices.items():
+        graph.putIndex('group', 'group', str(vertex['group']), 'vertex', _id)
+    names = args.benchmarks or [name for name, func in BENCHMARKS]
+    print('%-16s %8s %12s %12s %14s' % ('benchmark', 'ops', 'requests/op',
+                                        'ms/op', 'peak memory KB'))
+    with fake:
+        for name in names:
+            output = subprocess.check_output([
+                sys.executable, __file__, '--vertices', str(args.vertices),
+                '--child', name, fake.url])
+            result = simplejson.loads(output.splitlines()[-1])
+            print('%-16s %8d %12.2f %12.3f %14d' % (
+                name, result['operations'], result['requestsPerOp'],
+                result['secondsPerOp'] * 1000, result['peakMemoryKB']))
+
+
+if __name__ == '__main__':
+    main()
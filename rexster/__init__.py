@@ -1,25 +1,858 @@
 #!/usr/bin/env python
 #-*- coding:utf-8 -*-
 
+import Queue
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+from decimal import Decimal
+
 import requests
 import simplejson
 
+from rexster.metrics import RequestStats, endpointTemplate
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 
 class RexsterException(BaseException):
     pass
 
 
+class _Node(object):
+    """A Rexster instance of a multi-node connection"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.outstanding = 0
+        self.healthy = True
+
+
+class _Flight(object):
+    """A request in flight, whose outcome is shared by the identical
+    requests made meanwhile"""
+
+    def __init__(self):
+        self.response = None
+        self.error = None
+        self._done = threading.Event()
+
+    def finish(self, response=None, error=None):
+        self.response, self.error = response, error
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+def _checkHealthEvery(connection, interval, stop):
+    """Checks the health of the nodes of a connection, given by weak
+    reference, every interval seconds until stop is set"""
+    while not stop.wait(interval):
+        alive = connection()
+        if alive is None:
+            return
+        alive.checkHealth()
+        alive = None
+
+
+class RexsterConnection(object):
+    """An class wrapping a pooled keep-alive HTTP session. It is
+    owned by a RexsterServer and shared by every graph, element
+    and index created from it"""
+
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+    HEALTH_TIMEOUT = 5.0
+
+    def __init__(self, pool_size=10, keep_alive=True, timeout=None,
+                 retries=3, backoff=0.1, coalesce=False):
+        """Creates a new connection
+        @params pool_size: Maximum number of pooled connections per host
+        @params keep_alive: Whether connections are kept open between
+        requests
+        @params timeout: Default timeout in seconds for every request
+        @params retries: Number of retries of an idempotent request
+        failing to connect or timing out
+        @params backoff: Seconds to wait before the first retry, doubled
+        on each following one
+        @params coalesce: Whether a GET identical to one in flight waits
+        for it and shares its response instead of being sent"""
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.session(config={
+            'keep_alive': keep_alive,
+            'pool_connections': pool_size,
+            'pool_maxsize': pool_size})
+        self.listeners = []
+        self.coalesce = coalesce
+        # Number of GETs answered by a request in flight, in total and
+        # by endpoint template
+        self.coalesced = 0
+        self.coalescedEndpoints = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.nodes = []
+        self._turn = 0
+        self._stop = None
+
+    def addListener(self, listener):
+        """Registers a callable invoked after every request with the
+        arguments (method, endpoint, status, latency, size), where
+        endpoint is the URL template given by endpointTemplate, status
+        is None if no response was received, latency is in seconds
+        and size is the body length in bytes, None if unknown
+        @params listener: The callable, e.g. a RequestStats object"""
+        self.listeners.append(listener)
+
+    def removeListener(self, listener):
+        """Unregisters a listener added with addListener"""
+        self.listeners.remove(listener)
+
+    def _notify(self, method, url, response, latency, streamed):
+        status = size = None
+        if response is not None:
+            status = response.status_code
+            if not streamed:
+                size = len(response.content or b'')
+            elif response.headers.get('content-length'):
+                size = int(response.headers['content-length'])
+        endpoint = endpointTemplate(url)
+        for listener in self.listeners:
+            listener(method, endpoint, status, latency, size)
+
+    def _send(self, method, url, **kwargs):
+        response = None
+        started = time.time()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        finally:
+            if self.listeners:
+                self._notify(method, url, response, time.time() - started,
+                             kwargs.get('prefetch') is False)
+        # Newer versions of requests only set error for connection
+        # failures, while every check in this module relies on it
+        # being set for error statuses as well
+        if response.error is None and response.status_code >= 400:
+            response.error = requests.exceptions.HTTPError(
+                "%s Error" % response.status_code)
+        return response
+
+    def request(self, method, url, **kwargs):
+        """Sends a request through the pooled session, retrying
+        idempotent verbs with exponential backoff
+        @params method: HTTP verb
+        @params url: The request URL
+        @params kwargs: Extra arguments for requests, e.g. a
+        per-request timeout
+
+        @returns The response object"""
+        method = method.upper()
+        kwargs.setdefault('timeout', self.timeout)
+        if method == 'GET' and self.coalesce:
+            return self._coalesced(url, **kwargs)
+        return self._retrying(method, url, **kwargs)
+
+    def _coalesced(self, url, **kwargs):
+        """Sends a GET unless an identical one is in flight, in which
+        case its response is waited for and returned. Responses are
+        read whole, even if not prefetched, so they can be shared"""
+        key = (url, simplejson.dumps(kwargs.get('params'), sort_keys=True))
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+                endpoint = endpointTemplate(url)
+                self.coalescedEndpoints[endpoint] = \
+                    self.coalescedEndpoints.get(endpoint, 0) + 1
+        if not leader:
+            return flight.wait()
+        try:
+            response = self._retrying('GET', url, **kwargs)
+            # Reads the body, iter_content() then replays it to each
+            # of the callers sharing the response
+            response.content
+        except BaseException as e:
+            flight.finish(error=e)
+            raise
+        else:
+            flight.finish(response)
+            return response
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+    def _retrying(self, method, url, **kwargs):
+        attempts = 1
+        if method in self.IDEMPOTENT_METHODS:
+            attempts += self.retries
+        for attempt in range(attempts):
+            node = self._route(method, url)
+            target = url
+            if node is not None:
+                target = node.url + url[len(self.nodes[0].url):]
+            try:
+                return self._send(method, target, **kwargs)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout):
+                if node is not None and method == 'GET':
+                    # Ejected until a health check admits it again, the
+                    # next attempt goes to another node
+                    node.healthy = False
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(self.backoff * (2 ** attempt))
+            finally:
+                if node is not None:
+                    with self._lock:
+                        node.outstanding -= 1
+
+    def setHosts(self, hosts, health_interval=10.0):
+        """Spreads the requests to the first host, the primary, over
+        several Rexster instances sharing the same backend. GETs go
+        to the healthy instance with the fewest requests outstanding,
+        the other verbs, including Gremlin scripts, to the primary
+        @params hosts: The server URLs, the primary first
+        @params health_interval: Seconds between two health checks of
+        every instance, None to only check them with checkHealth(). The
+        checks stop on close() or once the connection is garbage
+        collected"""
+        self.close()
+        self.nodes = [_Node(host) for host in hosts]
+        if health_interval:
+            stop = self._stop = threading.Event()
+            # The thread only holds a weak reference to the connection
+            connection = weakref.ref(self, lambda ref: stop.set())
+            thread = threading.Thread(target=_checkHealthEvery,
+                                      args=(connection, health_interval,
+                                            stop))
+            thread.daemon = True
+            thread.start()
+
+    def _route(self, method, url):
+        """Returns the node a request is sent to, None if the URL does
+        not belong to the primary"""
+        if not self.nodes or not url.startswith(self.nodes[0].url):
+            return None
+        with self._lock:
+            node = self.nodes[0]
+            if method == 'GET':
+                healthy = [n for n in self.nodes if n.healthy] or [node]
+                fewest = min(n.outstanding for n in healthy)
+                # Ties are served in turn, or sequential clients would
+                # only ever read from the first node
+                idle = [n for n in healthy if n.outstanding == fewest]
+                node = idle[self._turn % len(idle)]
+                self._turn += 1
+            node.outstanding += 1
+        return node
+
+    def checkHealth(self):
+        """Requests the root endpoint of every node, ejecting the nodes
+        failing to answer and admitting again the ones answering"""
+        timeout = self.timeout or self.HEALTH_TIMEOUT
+        for node in self.nodes:
+            try:
+                r = self.session.get(node.url, timeout=timeout)
+                node.healthy = r.status_code < 400
+            except requests.exceptions.RequestException:
+                node.healthy = False
+
+    def close(self):
+        """Stops the periodic health checks"""
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request('PUT', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+
+# Lightweight edge representation, see Vertex.getOutEdgeTuples
+EdgeTuple = namedtuple('EdgeTuple', ['id', 'label', 'outV', 'inV'])
+
+
+class _ResponseReader(object):
+    """A file-like object reading the body of a streamed response
+    as it arrives"""
+
+    def __init__(self, response, chunk_size=65536):
+        self._chunks = response.iter_content(chunk_size)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _floats(value):
+    """Turns the Decimal numbers built by ijson into floats"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, dict):
+        return dict((k, _floats(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_floats(v) for v in value]
+    return value
+
+
+def _iterResults(response):
+    """Yields the items of the results list of a response. When
+    ijson is installed and the response was requested with
+    prefetch=False, items are decoded while the body is streamed
+    instead of after reading it whole"""
+    if response.error or ijson is None:
+        content = simplejson.loads(response.content)
+        if response.error:
+            raise RexsterException(content['message'])
+        for item in content['results']:
+            yield item
+        return
+    for item in ijson.items(_ResponseReader(response), 'results.item'):
+        yield _floats(item)
+
+
+def _returnKeys(keys):
+    """Returns the request parameters limiting the property maps of
+    the returned elements to the given keys, or None for all of them"""
+    if keys is None:
+        return None
+    return {'rexster.returnKeys': '[%s]' % ','.join(keys)}
+
+
+class _Prefetch(object):
+    """Runs a call in a background thread so its result is ready
+    by the time it is needed"""
+
+    def __init__(self, func, *args):
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run, args=(func, args))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, func, args):
+        try:
+            self._result = func(*args)
+        except BaseException as e:
+            self._error = e
+
+    def result(self):
+        """Waits for the call and returns its result, raising the
+        exception of the call if it failed"""
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+# Marks a removed key among the changes recorded in edit mode
+_REMOVED = object()
+
+_KEYS = {}
+
+
+def _internKey(key):
+    """Returns a shared copy of a property key, so the many copies
+    decoded from different responses do not each take memory"""
+    return _KEYS.setdefault(key, key)
+
+
+class BulkResult(object):
+    """The outcome of RexsterExecutor.map: the result of every item,
+    None for the failed ones, and the errors as (index, item,
+    exception) tuples sorted by index"""
+
+    def __init__(self, size):
+        self.results = [None] * size
+        self.errors = []
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def check(self):
+        """Raises the exception of the first failed item, if any
+
+        @returns The list of results"""
+        if self.errors:
+            raise self.errors[0][2]
+        return self.results
+
+
+class RexsterExecutor(object):
+    """A pool of threads running independent calls, e.g. element
+    lookups or removals, with bounded concurrency. Threads are
+    started on first use"""
+
+    def __init__(self, workers=10, owner=None):
+        """Creates a new executor
+        @params workers: Maximum number of concurrent calls
+        @params owner: Optional object, e.g. a graph, whose garbage
+        collection stops the threads"""
+        self.workers = workers
+        self._tasks = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._owner = None
+        if owner is not None:
+            # Held by the running threads, not by the owner
+            self._owner = weakref.ref(
+                owner, lambda ref: self.shutdown())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def _work(self, tasks):
+        self._local.worker = True
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            task()
+            # Does not keep the last callable, and its owner, alive
+            task = None
+
+    def map(self, func, items):
+        """Applies a callable to every item concurrently, collecting
+        the exception raised for each failed item instead of stopping.
+        Called from one of the executor threads, it runs the items in
+        that thread, as queueing them could wait on busy threads forever
+        @params func: The callable
+        @params items: An iterable of items
+
+        @returns A BulkResult with the results in the order of the items"""
+        items = list(items)
+        result = BulkResult(len(items))
+        if not items:
+            return result
+        lock = threading.Lock()
+        done = threading.Event()
+        pending = [len(items)]
+
+        def run(index, item):
+            try:
+                result.results[index] = func(item)
+            except BaseException as e:
+                with lock:
+                    result.errors.append((index, item, e))
+            with lock:
+                pending[0] -= 1
+                if not pending[0]:
+                    done.set()
+
+        if getattr(self._local, 'worker', False):
+            for index, item in enumerate(items):
+                run(index, item)
+            return result
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work,
+                                          args=(self._tasks,))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            for index, item in enumerate(items):
+                self._tasks.put(lambda index=index, item=item:
+                                run(index, item))
+        while not done.is_set():
+            done.wait(1)
+        result.errors.sort(key=lambda error: error[0])
+        return result
+
+    def shutdown(self, wait=True):
+        """Stops the threads once the queued calls are done. The
+        executor starts new threads if used again
+        @params wait: Whether to wait for the threads to stop"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+            tasks, self._tasks = self._tasks, Queue.Queue()
+        for thread in threads:
+            tasks.put(None)
+        if wait:
+            for thread in threads:
+                if thread is not threading.current_thread():
+                    thread.join()
+
+
+def _fanout(func, items, workers):
+    """Applies a callable to every item from at most workers
+    threads of their own, raising the first error
+
+    @returns The list of results, in the order of the items"""
+    items = list(items)
+    with RexsterExecutor(min(workers, len(items))) as executor:
+        return executor.map(func, items).check()
+
+
+class GremlinScript(object):
+    """A Gremlin script taking bound parameters. Its source does not
+    change between calls, so the server compiles it only once and
+    values never need to be interpolated into it"""
+
+    def __init__(self, source, params=(), mutates=False):
+        """Creates a new script
+        @params source: The Gremlin source
+        @params params: Names of the parameters the script expects
+        @params mutates: Whether the script changes the graph, in which
+        case its results are never cached"""
+        self.source = source
+        self.params = tuple(params)
+        self.mutates = mutates
+
+    def bind(self, *args, **kwargs):
+        """Binds values to the parameters of the script, given by
+        position or by name
+
+        @returns The dict of bound parameters"""
+        if len(args) > len(self.params):
+            raise RexsterException("Too many parameters for the script")
+        bound = dict(zip(self.params, args))
+        for name, value in kwargs.items():
+            if name not in self.params:
+                raise RexsterException("Unknown script parameter %s" % name)
+            if name in bound:
+                raise RexsterException("Parameter %s bound twice" % name)
+            bound[name] = value
+        missing = [name for name in self.params if name not in bound]
+        if missing:
+            raise RexsterException("Missing script parameters: %s"
+                                   % ", ".join(missing))
+        return bound
+
+
+SCRIPTS = {
+    'vertices': GremlinScript('ids.collect{ g.v(it) }', ['ids']),
+    'edges': GremlinScript('ids.collect{ g.e(it) }', ['ids']),
+    'shortest_path': GremlinScript(
+        '(new edu.uci.ics.jung.algorithms.shortestpath'
+        '.DijkstraShortestPath(new GraphJung(g)))'
+        '.getPath(g.v(start), g.v(end))', ['start', 'end']),
+    'batch': GremlinScript("""created = []
+resolve = { ref ->
+    if (ref[0] == 'new') return created[ref[1]]
+    if (ref[0] == 'vertex') return g.v(ref[1])
+    return g.e(ref[1])
+}
+for (op in ops) {
+    if (op[0] == 'vertex')
+        created << g.addVertex(op[1], op[2])
+    else if (op[0] == 'edge')
+        created << g.addEdge(op[1], resolve(op[2]), resolve(op[3]),
+                             op[4], op[5])
+    else
+        resolve(op[1]).setProperty(op[2], op[3])
+}
+created.collect{ it.id }""", ['ops'], mutates=True),
+    'index_put': GremlinScript("""idx = g.idx(name)
+for (entry in entries)
+    idx.put(entry[0], entry[1],
+            entry[2] == 'vertex' ? g.v(entry[3]) : g.e(entry[3]))
+entries.size()""", ['name', 'entries'], mutates=True),
+    'index_remove': GremlinScript("""idx = g.idx(name)
+for (entry in entries)
+    idx.remove(entry[0], entry[1],
+               entry[2] == 'vertex' ? g.v(entry[3]) : g.e(entry[3]))
+entries.size()""", ['name', 'entries'], mutates=True),
+    'count_vertices': GremlinScript('g.V.count()'),
+    'count_edges': GremlinScript('g.E.count()'),
+    'group_count_vertices': GremlinScript(
+        'm = [:]\ng.V.groupCount(m){ it.getProperty(key) }.iterate()\n'
+        'm.collect{ [it.key, it.value] }',
+        ['key']),
+    'group_count_edges': GremlinScript(
+        'm = [:]\ng.E.groupCount(m){ it.getProperty(key) }.iterate()\n'
+        'm.collect{ [it.key, it.value] }',
+        ['key']),
+    'changed_vertices': GremlinScript(
+        'g.V.filter{ it.getProperty(key) != null && '
+        'it.getProperty(key) >= since }', ['key', 'since']),
+    'changed_edges': GremlinScript(
+        'g.E.filter{ it.getProperty(key) != null && '
+        'it.getProperty(key) >= since }', ['key', 'since']),
+    'index_get': GremlinScript(
+        'idx = g.idx(name)\n'
+        'pairs.collect{ idx.get(it[0], it[1]).toList() }', ['name', 'pairs']),
+}
+
+
+class ElementCache(object):
+    """An LRU identity map of the elements of a graph keyed by
+    their URL. Entries are evicted when the cache is full or, if
+    a ttl is given, after ttl seconds"""
+
+    def __init__(self, max_size=10000, ttl=None):
+        """Creates a new cache
+        @params max_size: Maximum number of elements held
+        @params ttl: Optional number of seconds an element is valid"""
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, url):
+        """Returns the element cached for the given URL
+        @params url: The element REST URL
+
+        @returns The element or None"""
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is None:
+                return None
+            element, expires = entry
+            if expires is not None and expires < time.time():
+                return None
+            self._entries[url] = entry
+            return element
+
+    def put(self, element):
+        """Stores an element, evicting the least recently used ones
+        @params element: The Vertex or Edge to cache"""
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        with self._lock:
+            self._entries.pop(element.url, None)
+            self._entries[element.url] = (element, expires)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def setProperty(self, url, key, value):
+        """Writes a property update through to the cached element"""
+        element = self.get(url)
+        if element is not None and element._properties is not None:
+            element._properties[key] = value
+
+    def removeProperty(self, url, key):
+        """Writes a property removal through to the cached element"""
+        element = self.get(url)
+        if element is not None and element._properties is not None:
+            element._properties.pop(key, None)
+
+    def invalidate(self, url):
+        """Drops the element cached for the given URL"""
+        with self._lock:
+            self._entries.pop(url, None)
+
+    def invalidateEdgesOf(self, vertex):
+        """Drops the cached edges incident to the given vertex"""
+        # Handles may hold int ids, edge maps hold strings
+        _id = unicode(vertex.getId())
+        with self._lock:
+            for url, (element, expires) in list(self._entries.items()):
+                properties = element._properties or {}
+                if isinstance(element, Edge) and \
+                        _id in (unicode(properties.get('_outV')),
+                                unicode(properties.get('_inV'))):
+                    del self._entries[url]
+
+    def clear(self):
+        """Drops every cached element"""
+        with self._lock:
+            self._entries.clear()
+
+
+class QueryCache(object):
+    """An LRU cache of Gremlin results keyed by script and bound
+    parameters. Entries are evicted when the cache is full or, if a
+    ttl is given, after ttl seconds. The graph owning the cache drops
+    it whole on every change made through it. Results are kept as
+    response bodies and decoded for each caller, as the elements built
+    from them use the decoded maps as their own properties"""
+
+    def __init__(self, max_size=1000, ttl=None):
+        """Creates a new cache
+        @params max_size: Maximum number of results held
+        @params ttl: Optional number of seconds a result is valid"""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, script, params):
+        return script, simplejson.dumps(params, sort_keys=True)
+
+    def get(self, script, params):
+        """Returns the result cached for a script and its parameters
+        @params script: The script source
+        @params params: The dict of bound parameters, or None
+
+        @returns A new copy of the decoded response or None"""
+        key = self._key(script, params)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[1] is not None \
+                    and entry[1] < time.time():
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries[key] = entry
+        return simplejson.loads(entry[0])
+
+    def put(self, script, params, content):
+        """Stores the result of a script, evicting the least recently
+        used ones
+        @params script: The script source
+        @params params: The dict of bound parameters, or None
+        @params content: The response body"""
+        key = self._key(script, params)
+        expires = None
+        if self.ttl is not None:
+            expires = time.time() + self.ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (content, expires)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drops every cached result"""
+        with self._lock:
+            self._entries.clear()
+
+
+class ChangeLog(object):
+    """A log of the changes made through a graph, as (operation,
+    kind, id, data) tuples replayed by GraphSnapshot.apply(). Entries
+    are numbered from the creation of the log, positions stay valid
+    after older entries are truncated"""
+
+    def __init__(self):
+        self.offset = 0
+        self._entries = []
+        self._lock = threading.Lock()
+        self._readers = weakref.WeakSet()
+        self._followed = False
+
+    def __len__(self):
+        """Returns the position following the last entry"""
+        return self.offset + len(self._entries)
+
+    def append(self, operation, kind, _id, data=None):
+        """Records a change
+        @params operation: 'put', 'unset' or 'remove'
+        @params kind: 'vertex' or 'edge'
+        @params _id: The element unique identifier
+        @params data: The properties put or the keys unset"""
+        with self._lock:
+            if self._followed and not self._readers:
+                # Every reader is gone, nothing will read the entry
+                self.offset += len(self._entries) + 1
+                del self._entries[:]
+                return
+            self._entries.append((operation, kind, _id, data))
+
+    def since(self, position):
+        """Returns the entries recorded from a position on"""
+        with self._lock:
+            if position < self.offset:
+                raise RexsterException("Changes before %d were truncated"
+                                       % position)
+            return self._entries[position - self.offset:]
+
+    def truncate(self, position):
+        """Forgets the entries recorded before a position"""
+        with self._lock:
+            del self._entries[:max(position - self.offset, 0)]
+            self.offset = max(position, self.offset)
+
+    def follow(self, reader):
+        """Registers a reader of the log, e.g. a GraphSnapshot, whose
+        position attribute is the position following the last entry it
+        read. Once readers are registered, the entries read by all of
+        them are dropped by compact(), and nothing is kept while none is
+        alive
+        @params reader: The reader, held by weak reference"""
+        with self._lock:
+            self._readers.add(reader)
+            self._followed = True
+
+    def compact(self):
+        """Truncates the entries every registered reader has read"""
+        with self._lock:
+            positions = [reader.position for reader in self._readers
+                         if reader.position is not None]
+        if self._followed:
+            self.truncate(min(positions) if positions else len(self))
+
+
 class RexsterServer(object):
     """An class that implements a way to connect to
     a Rexster Instance from Python"""
-    def __init__(self, host):
+    def __init__(self, host, pool_size=10, keep_alive=True, timeout=None,
+                 retries=3, backoff=0.1, coalesce=False,
+                 health_interval=10.0):
+        """Connects to a Rexster server
+        @params host: The server URL, or a list of the URLs of
+        instances sharing the same backend, the primary first. Reads
+        are then balanced over the healthy instances and writes sent to
+        the primary, see RexsterConnection.setHosts
+        @params pool_size, keep_alive, timeout, retries, backoff, coalesce:
+        Settings of the RexsterConnection shared by every object of this
+        server
+        @params health_interval: Seconds between the health checks of
+        the instances when several are given"""
+        self.connection = RexsterConnection(pool_size, keep_alive, timeout,
+                                            retries, backoff, coalesce)
+        if isinstance(host, (list, tuple)):
+            self.connection.setHosts(host, health_interval)
+            host = host[0]
         self.host = host
-        r = requests.get(host)
+        try:
+            r = self.connection.get(host)
+        except requests.exceptions.RequestException:
+            raise RexsterException("Could not connect to a Rexster server")
         if r.error:
             raise RexsterException("Could not connect to a Rexster server")
         else:
             self.data = simplejson.loads(r.content)
 
+    def close(self):
+        """Stops the periodic health checks of the instances, which is
+        otherwise done when the connection is garbage collected"""
+        self.connection.close()
+
     def name(self):
         """Return server name"""
         return self.data.get('name')
@@ -37,28 +870,124 @@ class RexsterServer(object):
         return self.data.get('graphs')
 
 
+class _Projection(dict):
+    """The property map of an element fetched with only some of its
+    keys. Reading one of the other keys loads the whole element"""
+
+    __slots__ = ('element',)
+
+    def __init__(self, element, properties):
+        dict.__init__(self, properties)
+        self.element = element
+
+    def _complete(self):
+        if self.element._properties is self:
+            self.element._load()
+        return self.element._properties
+
+    def __missing__(self, key):
+        return self._complete()[key]
+
+    def get(self, key, default=None):
+        if key in self:
+            return dict.get(self, key)
+        return self._complete().get(key, default)
+
+
+def _element(klass, graph, properties, keys=None):
+    """Builds a Vertex or Edge from a property map returned by the
+    server, projected on the given keys when not None"""
+    element = klass(graph, properties.get('_id'), properties)
+    if keys is not None:
+        element._properties = _Projection(element, properties)
+    return element
+
+
 class Element(object):
     """An class defining an Element object composed
     by a collection of key/value properties for the
     Rexster compatible database"""
 
-    def __init__(self, graph, url):
+    # Elements are often held by the hundred thousand, so they carry
+    # no instance dict and Vertex and Edge derive their URL from the
+    # graph URL instead of storing it
+    __slots__ = ('graph', '_id', '_properties', '_url', '_edits')
+
+    def __init__(self, graph, url, properties=None, lazy=False, _id=None):
         """Creates a new element
         @params graph: The graph object the element belongs
-        @params url: The element REST URL
+        @params url: The element REST URL, None to derive it from the
+        graph URL, the class PATH and the id
+        @params properties: Optional property map already returned by the
+        server (e.g. an item of a listing), used as is instead of
+        fetching it
+        @params lazy: If True and no properties are given, the element
+        is not fetched until its properties are needed
+        @params _id: The element unique identifier, if known
 
         @returns The element"""
-        self.url = url
+        self._url = url
         self.graph = graph
-        r = requests.get(url)
+        self._id = _id
+        self._properties = None
+        self._edits = None
+        if properties is not None:
+            self._setProperties(properties)
+        elif not lazy:
+            self._load()
+
+    @property
+    def url(self):
+        """The element REST URL"""
+        if self._url is None:
+            return "%s/%s/%s" % (self.graph.url, self.PATH, self._id)
+        return self._url
+
+    def _setProperties(self, properties):
+        self._properties = properties
+        self._id = properties.get('_id', self._id)
+
+    def _load(self, keys=None):
+        """Fetches the element properties from the server
+        @params keys: Optional list of the property keys fetched, the
+        other ones are loaded when first read"""
+        r = self.graph.connection.get(self.url, params=_returnKeys(keys))
         content = simplejson.loads(r.content)
         properties = content.get('results')
         if not properties:
             raise RexsterException(content['message'])
-        self.properties = {}
-        for key, value in properties.iteritems():
-            self.properties[key] = value
-        self._id = self.properties.get('_id')
+        self._setProperties(properties)
+        if keys is not None:
+            self._properties = _Projection(self, properties)
+        elif self.graph.cache is not None:
+            self.graph.cache.put(self)
+
+    def _fresh(self, key=None):
+        """Returns the current property map of the element, taken
+        from the graph cache when enabled and fetched otherwise
+        @params key: Optional key read, the only one fetched when the
+        element holds a projection"""
+        if self.graph.cache is not None:
+            cached = self.graph.cache.get(self.url)
+            if cached is not None:
+                return cached.properties
+        projection = self._properties
+        if key is not None and isinstance(projection, _Projection):
+            self._load([key])
+            projection.pop(key, None)
+            projection.update(self._properties)
+            self._properties = projection
+            return projection
+        self._load()
+        return self._properties
+
+    @property
+    def properties(self):
+        """The property map of the element, fetched on first
+        access for lazy elements"""
+        if self._properties is None:
+            self._load()
+        return self._properties
 
     def getId(self):
         """Returns the unique identifier of the element
@@ -67,114 +996,346 @@ class Element(object):
         return self._id
 
     def setProperty(self, key, value):
-        """Sets the property of the element to the given value
+        """Sets the property of the element to the given value,
+        recorded until flush() in edit mode
         @params key: The property key to set
         @params value: The value to set"""
-        r = requests.post(self.url, data={key: value})
+        if self._edits is not None:
+            self._edits[key] = value
+            return
+        r = self.graph.connection.post(self.url, data={key: value})
         if r.error:
             error_msg = simplejson.loads(r.content)['message']
             raise RexsterException(error_msg)
-        self.properties[key] = value
+        self.graph._mutated()
+        self.graph._record('put', self.KIND, self._id, {key: value})
+        if self._properties is not None:
+            self._properties[key] = value
+        if self.graph.cache is not None:
+            self.graph.cache.setProperty(self.url, key, value)
 
     def getProperty(self, key):
         """Gets the value of the property for the given key
         @params key: The key which value is being retrieved
 
         @returns The value of the property with the given key"""
-        r = requests.get(self.url)
-        properties = simplejson.loads(r.content)
-        if r.error:
-            raise RexsterException(properties['message'])
-        else:
-            return properties['results'].get(key)
+        return self._fresh(key).get(key)
 
     def getPropertyKeys(self):
         """Returns a set with the property keys of the element
 
         @returns Set of property keys"""
-        r = requests.get(self.url)
-        properties = simplejson.loads(r.content)
-        if r.error:
-            raise RexsterException(properties['message'])
-        else:
-            return properties['results'].keys()
+        return self._fresh().keys()
 
     def removeProperty(self, key):
-        """Removes the value of the property for the given key
+        """Removes the value of the property for the given key,
+        recorded until flush() in edit mode
         @params key: The key which value is being removed"""
-        r = requests.delete(self.url, params=key)
+        if self._edits is not None:
+            self._edits[key] = _REMOVED
+            return
+        r = self.graph.connection.delete(self.url, params={key: ''})
         if r.error:
             error_msg = simplejson.loads(r.content)['message']
             raise RexsterException(error_msg)
-        self.properties.pop(key)
+        self.graph._mutated()
+        self.graph._record('unset', self.KIND, self._id, [key])
+        if self._properties is not None:
+            self._properties.pop(key, None)
+        if self.graph.cache is not None:
+            self.graph.cache.removeProperty(self.url, key)
+
+    def setProperties(self, properties):
+        """Sets many properties of the element in a single request,
+        or records them until flush() in edit mode
+        @params properties: Dict of the values to set by key"""
+        if self._edits is not None:
+            self._edits.update(properties)
+            return
+        self._write('post', properties)
+        for key, value in properties.items():
+            self._updated(key, value)
+
+    def _write(self, method, properties):
+        data = simplejson.dumps(properties)
+        r = self.graph.connection.request(
+            method, self.url, data=data,
+            headers={'Content-Type': 'application/json'})
+        if r.error:
+            error_msg = simplejson.loads(r.content)['message']
+            raise RexsterException(error_msg)
+        self.graph._mutated()
+
+    def _updated(self, key, value):
+        """Applies a property change to the local and cached copies"""
+        if value is _REMOVED:
+            self.graph._record('unset', self.KIND, self._id, [key])
+            if self._properties is not None:
+                self._properties.pop(key, None)
+            if self.graph.cache is not None:
+                self.graph.cache.removeProperty(self.url, key)
+        else:
+            self.graph._record('put', self.KIND, self._id, {key: value})
+            if self._properties is not None:
+                self._properties[key] = value
+            if self.graph.cache is not None:
+                self.graph.cache.setProperty(self.url, key, value)
+
+    def edit(self):
+        """Enters edit mode: setProperty, setProperties and
+        removeProperty are recorded locally and sent together by
+        flush(). The element can be used as a context manager
+        flushing on exit, or discarding the changes on error
+
+        @returns The element"""
+        if self._edits is None:
+            self._edits = {}
+        return self
+
+    def flush(self):
+        """Sends the changes recorded in edit mode without reading the
+        element first, a POST of the keys set and a DELETE of the keys
+        removed, and leaves edit mode. Other keys are left as they are
+        on the server. The two requests are not atomic: if the DELETE
+        fails, the keys set are written and the error is raised"""
+        edits, self._edits = self._edits, None
+        if not edits:
+            return
+        removed = [key for key, value in edits.items() if value is _REMOVED]
+        properties = dict((key, value) for key, value in edits.items()
+                          if value is not _REMOVED)
+        if properties:
+            self.setProperties(properties)
+        if removed:
+            r = self.graph.connection.delete(
+                self.url, params=dict((key, '') for key in removed))
+            if r.error:
+                error_msg = simplejson.loads(r.content)['message']
+                raise RexsterException(error_msg)
+            self.graph._mutated()
+            for key in removed:
+                self._updated(key, _REMOVED)
+
+    def discard(self):
+        """Leaves edit mode, dropping the recorded changes"""
+        self._edits = None
+
+    def __enter__(self):
+        return self.edit()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
 
     def __eq__(self, other):
         """Two elements are equals when they are the same type() and the same id
         @params other: the objects to be compared with"""
-	if type(self) == type(other):
-		return self.getId() == other.getId()
-	else:
-		return False
+        if type(self) == type(other):
+            return self.getId() == other.getId()
+        if isinstance(other, Element):
+            return False
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
 
 
 class Vertex(Element):
     """An abstract class defining a Vertex object representing
     a node of the graph with a set of properties"""
 
-    def __init__(self, graph, _id):
+    __slots__ = ()
+    PATH = 'vertices'
+    KIND = 'vertex'
+
+    def __init__(self, graph, _id, properties=None, lazy=False):
         """Creates a new vertex
         @params graph: The graph object the vertex belongs
         @params _id: The vertex unique identifier
+        @params properties: Optional property map already returned by
+        the server
+        @params lazy: If True, defer fetching the vertex until its
+        properties are needed
 
         @returns The vertex"""
-        url = "%s/vertices/%s" % (graph.url, _id)
-        super(Vertex, self).__init__(graph, url)
+        super(Vertex, self).__init__(graph, None, properties, lazy, _id)
 
-    def _generator(self, generator):
+    def _generator(self, generator, keys=None):
         for item in generator:
-            yield Edge(self.graph, item.get('_id'))
+            yield _element(Edge, self.graph, item, keys)
+
+    def _adjacency(self, resource, label=None, keys=None):
+        """Requests an adjacency resource of the vertex, e.g. outE
+        @params resource: The resource name
+        @params label: Optional edge label to filter by
+        @params keys: Optional list of the property keys returned
+
+        @returns A generator over the results"""
+        params = _returnKeys(keys) or {}
+        if label:
+            params['_label'] = label
+        r = self.graph.connection.get("%s/%s" % (self.url, resource),
+                                      params=params, prefetch=False)
+        return _iterResults(r)
 
-    def getOutEdges(self, label=None):
+    def getOutEdges(self, label=None, properties=None):
         """Gets all the outgoing edges of the node. If label
         parameter is provided, it only returns the edges of
         the given label
         @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys fetched,
+        the other ones are loaded when first read
 
         @returns A generator function with the outgoing edges"""
-        if label:
-            url = "%s/outE?_label=%s" % (self.url, label)
-        else:
-            url = "%s/outE" % self.url
-        r = requests.get(url)
-        return self._generator(simplejson.loads(r.content)['results'])
+        return self._generator(self._adjacency('outE', label, properties),
+                               properties)
 
-    def getInEdges(self, label=None):
+    def getInEdges(self, label=None, properties=None):
         """Gets all the incoming edges of the node. If label
         parameter is provided, it only returns the edges of
         the given label
         @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys fetched,
+        the other ones are loaded when first read
 
         @returns A generator function with the incoming edges"""
-        if label:
-            url = "%s/inE?_label=%s" % (self.url, label)
-        else:
-            url = "%s/inE" % self.url
-        r = requests.get(url)
-        return self._generator(simplejson.loads(r.content)['results'])
+        return self._generator(self._adjacency('inE', label, properties),
+                               properties)
 
-    def getBothEdges(self, label=None):
+    def getBothEdges(self, label=None, properties=None):
         """Gets all the edges of the node. If label
         parameter is provided, it only returns the edges of
         the given label
         @params label: Optional parameter to filter the edges
+        @params properties: Optional list of the property keys fetched,
+        the other ones are loaded when first read
 
         @returns A generator function with the incoming edges"""
-        if label:
-            url = "%s/bothE?_label=%s" % (self.url, label)
-        else:
-            url = "%s/bothE" % self.url
-        r = requests.get(url)
-        return self._generator(simplejson.loads(r.content)['results'])
+        return self._generator(self._adjacency('bothE', label, properties),
+                               properties)
+
+    def _vertices(self, resource, label):
+        for item in self._adjacency(resource, label):
+            yield Vertex(self.graph, item.get('_id'), item)
+
+    def getOutVertices(self, label=None):
+        """Gets the vertices at the head of the outgoing edges
+        @params label: Optional parameter to filter the edges
+
+        @returns A generator function with the adjacent vertices"""
+        return self._vertices('out', label)
+
+    def getInVertices(self, label=None):
+        """Gets the vertices at the tail of the incoming edges
+        @params label: Optional parameter to filter the edges
+
+        @returns A generator function with the adjacent vertices"""
+        return self._vertices('in', label)
+
+    def getBothVertices(self, label=None):
+        """Gets the vertices adjacent through any edge
+        @params label: Optional parameter to filter the edges
+
+        @returns A generator function with the adjacent vertices"""
+        return self._vertices('both', label)
+
+    def _tuples(self, resource, label):
+        for item in self._adjacency(resource, label):
+            yield EdgeTuple(item.get('_id'), item.get('_label'),
+                            item.get('_outV'), item.get('_inV'))
+
+    def getOutEdgeTuples(self, label=None):
+        """Gets the outgoing edges as (id, label, outV, inV) tuples,
+        without building Edge objects
+        @params label: Optional parameter to filter the edges
+
+        @returns A generator function with EdgeTuple objects"""
+        return self._tuples('outE', label)
+
+    def getInEdgeTuples(self, label=None):
+        """Gets the incoming edges as (id, label, outV, inV) tuples,
+        without building Edge objects
+        @params label: Optional parameter to filter the edges
+
+        @returns A generator function with EdgeTuple objects"""
+        return self._tuples('inE', label)
+
+    def getBothEdgeTuples(self, label=None):
+        """Gets all the edges as (id, label, outV, inV) tuples,
+        without building Edge objects
+        @params label: Optional parameter to filter the edges
+
+        @returns A generator function with EdgeTuple objects"""
+        return self._tuples('bothE', label)
+
+    def getOutVertexIds(self, label=None):
+        """Gets the ids of the vertices at the head of the outgoing
+        edges, read from the edge listing in a single request
+        @params label: Optional parameter to filter the edges
+
+        @returns A generator function with the vertex ids"""
+        for edge in self.getOutEdgeTuples(label):
+            yield edge.inV
+
+    def getInVertexIds(self, label=None):
+        """Gets the ids of the vertices at the tail of the incoming
+        edges, read from the edge listing in a single request
+        @params label: Optional parameter to filter the edges
+
+        @returns A generator function with the vertex ids"""
+        for edge in self.getInEdgeTuples(label):
+            yield edge.outV
+
+    def getBothVertexIds(self, label=None):
+        """Gets the ids of the vertices adjacent through any edge,
+        read from the edge listing in a single request
+        @params label: Optional parameter to filter the edges
+
+        @returns A generator function with the vertex ids"""
+        # The id given to getVertex may be an int, the listing has strings
+        _id = unicode(self._id)
+        for edge in self.getBothEdgeTuples(label):
+            if unicode(edge.outV) == _id:
+                yield edge.inV
+            else:
+                yield edge.outV
+
+    def _count(self, resource, label):
+        """Counts the edges of an adjacency resource, e.g. outE, with
+        the server count endpoint, or by reading the edge listing on
+        servers without it"""
+        params = {'_label': label} if label else None
+        url = "%s/%sCount" % (self.url, resource[:-1])
+        r = self.graph.connection.get(url, params=params)
+        if r.status_code == 404:
+            return sum(1 for item in self._adjacency(resource, label))
+        content = simplejson.loads(r.content)
+        if r.error:
+            raise RexsterException(content['message'])
+        return content['totalSize']
+
+    def countOutEdges(self, label=None):
+        """Counts the outgoing edges of the node on the server
+        @params label: Optional parameter to filter the edges
+
+        @returns The number of edges"""
+        return self._count('outE', label)
+
+    def countInEdges(self, label=None):
+        """Counts the incoming edges of the node on the server
+        @params label: Optional parameter to filter the edges
+
+        @returns The number of edges"""
+        return self._count('inE', label)
+
+    def countBothEdges(self, label=None):
+        """Counts all the edges of the node on the server
+        @params label: Optional parameter to filter the edges
+
+        @returns The number of edges"""
+        return self._count('bothE', label)
 
     def __str__(self):
         return "Vertex %s: %s" % (self._id, self.properties)
@@ -184,26 +1345,33 @@ class Edge(Element):
     """An abstract class defining a Edge object representing
     a relationship of the graph with a set of properties"""
 
-    def __init__(self, graph, _id):
+    __slots__ = ()
+    PATH = 'edges'
+    KIND = 'edge'
+
+    def __init__(self, graph, _id, properties=None, lazy=False):
         """Creates a new edge
         @params graph: The graph object the edge belongs
         @params _id: The edge unique identifier
+        @params properties: Optional property map already returned by
+        the server
+        @params lazy: If True, defer fetching the edge until its
+        properties are needed
 
         @returns The edge"""
-        url = "%s/edges/%s" % (graph.url, _id)
-        super(Edge, self).__init__(graph, url)
+        super(Edge, self).__init__(graph, None, properties, lazy, _id)
 
     def getOutVertex(self):
         """Returns the origin Vertex of the relationship
 
         @returns The origin Vertex"""
-        return Vertex(self.graph, self.properties.get('_outV'))
+        return self.graph._getElement(Vertex, self.properties.get('_outV'))
 
     def getInVertex(self):
         """Returns the target Vertex of the relationship
 
         @returns The target Vertex"""
-        return Vertex(self.graph, self.properties.get('_inV'))
+        return self.graph._getElement(Vertex, self.properties.get('_inV'))
 
     def getLabel(self):
         """Returns the label of the relationship
@@ -215,15 +1383,203 @@ class Edge(Element):
         return "Edge %s: %s" % (self._id, self.properties)
 
 
+class TableRow(object):
+    """A row of an ElementTable, standing for one of its vertices
+    or edges"""
+
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def getId(self):
+        """Returns the unique identifier of the element"""
+        return self.table.ids[self.index]
+
+    def getProperty(self, key):
+        """Gets the value of a property stored in the table
+        @params key: One of the keys of the table"""
+        column = self.table.columns.get(key)
+        if column is None:
+            raise RexsterException("Property %s is not in the table" % key)
+        return column[self.index]
+
+    def element(self):
+        """Returns the lazy Vertex or Edge object of the row"""
+        return self.table.klass(self.table.graph, self.getId(), lazy=True)
+
+    def __eq__(self, other):
+        """A row equals any row or element of the same class and id"""
+        if isinstance(other, TableRow):
+            return self.table.klass is other.table.klass and \
+                self.getId() == other.getId()
+        if type(other) == self.table.klass:
+            return self.getId() == other.getId()
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+
+def _snapshotKeys(properties, edge_properties, weight, timestamp):
+    """Returns the vertex and edge property keys to request for a
+    snapshot"""
+    vertex_keys, edge_keys = list(properties), list(edge_properties)
+    if weight is not None:
+        edge_keys.append(weight)
+    if timestamp is not None:
+        vertex_keys.append(timestamp)
+        edge_keys.append(timestamp)
+    return vertex_keys, edge_keys
+
+
+def _tableKeys(keys):
+    """Returns the property keys to request for a table of the given
+    columns, None when they are all element fields"""
+    keys = [key for key in keys if not key.startswith('_')]
+    return keys or None
+
+
+class ElementTable(object):
+    """A columnar store of many vertices or edges, keeping their ids
+    and a selection of their properties in parallel lists instead of
+    one object and one dict per element"""
+
+    def __init__(self, graph, klass, keys):
+        """Creates an empty table
+        @params graph: The graph the elements belong to
+        @params klass: Vertex or Edge
+        @params keys: The property keys stored"""
+        self.graph = graph
+        self.klass = klass
+        self.keys = [_internKey(key) for key in keys]
+        self.ids = []
+        self.columns = dict((key, []) for key in self.keys)
+
+    def append(self, properties):
+        """Adds an element from its property map"""
+        self.ids.append(properties.get('_id'))
+        for key in self.keys:
+            self.columns[key].append(properties.get(key))
+
+    def column(self, key):
+        """Returns the list of values of a property, in row order"""
+        return self.columns[key]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.ids)
+        if not 0 <= index < len(self.ids):
+            raise IndexError(index)
+        return TableRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.ids)):
+            yield TableRow(self, index)
+
+
 class RexsterGraph(object):
 
-    def __init__(self, server, name):
+    def __init__(self, server, name, page_size=1000, cache=None,
+                 query_cache=None):
+        """Connects to a graph of the server
+        @params server: The RexsterServer hosting the graph
+        @params name: The graph name
+        @params page_size: Number of elements requested per page when
+        iterating over all the vertices or edges. None fetches the whole
+        collection in a single request
+        @params cache: Optional ElementCache reused by element lookups
+        @params query_cache: Optional QueryCache of gremlin_execute
+        results, cleared by every change made through the graph"""
         self.server = server
+        self.connection = server.connection
         self.name = name
         self.url = "%s/%s" % (server.host, name)
+        self.page_size = page_size
+        self.cache = cache
+        self.query_cache = query_cache
+        self.changes = None
+        self.scripts = dict(SCRIPTS)
+        self.executor = RexsterExecutor(self.connection.pool_size,
+                                        owner=self)
+        self._gremlin = None
+
+    def close(self):
+        """Stops the threads of the graph executor, which is otherwise
+        done when the graph is garbage collected"""
+        self.executor.shutdown()
+
+    def _getElement(self, klass, _id, lazy=False, keys=None):
+        """Returns the Vertex or Edge with the given id, taken from
+        the cache when it holds it"""
+        if self.cache is not None:
+            url = "%s/%s/%s" % (self.url, klass.PATH, _id)
+            element = self.cache.get(url)
+            if element is not None:
+                return element
+        if keys is None or lazy:
+            return klass(self, _id, lazy=lazy)
+        element = klass(self, _id, lazy=True)
+        element._load(keys)
+        return element
+
+    def _fetchPage(self, url, start, end, keys=None):
+        params = {'rexster.offset.start': start,
+                  'rexster.offset.end': end}
+        params.update(_returnKeys(keys) or {})
+        r = self.connection.get(url, params=params)
+        content = simplejson.loads(r.content)
+        if r.error:
+            raise RexsterException(content['message'])
+        return content['results']
+
+    def _paginate(self, url, keys=None):
+        """Yields every result of a listing URL page by page, using
+        the rexster.offset window. The next page is fetched in the
+        background while the current one is being consumed"""
+        if not self.page_size:
+            r = self.connection.get(url, params=_returnKeys(keys),
+                                    prefetch=False)
+            for item in _iterResults(r):
+                yield item
+            return
+        start = 0
+        pending = _Prefetch(self._fetchPage, url, start, self.page_size,
+                            keys)
+        while pending is not None:
+            results = pending.result()
+            pending = None
+            if len(results) >= self.page_size:
+                start += self.page_size
+                pending = _Prefetch(self._fetchPage, url, start,
+                                    start + self.page_size, keys)
+            for item in results:
+                yield item
+
+    def _mutated(self):
+        """Drops the cached query results after a change of the graph"""
+        if self.query_cache is not None:
+            self.query_cache.clear()
+
+    def _record(self, operation, kind, _id, data=None):
+        if self.changes is not None:
+            self.changes.append(operation, kind, _id, data)
+
+    def trackChanges(self):
+        """Starts recording the changes made through the graph in a
+        ChangeLog, used to refresh snapshots
+
+        @returns The ChangeLog"""
+        if self.changes is None:
+            self.changes = ChangeLog()
+        return self.changes
 
     def getMetadata(self):
-        r = requests.get(self.url)
+        r = self.connection.get(self.url)
         return simplejson.loads(r.content)
 
     def addVertex(self, _id=None):
@@ -235,38 +1591,248 @@ class RexsterGraph(object):
             url = "%s/vertices/%s" % (self.url, _id)
         else:
             url = "%s/vertices" % (self.url)
-        r = requests.post(url)
+        r = self.connection.post(url)
         if r.error:
             raise RexsterException("Could not create vertex")
         else:
+            self._mutated()
             properties = simplejson.loads(r.content)['results']
-            return Vertex(self, properties['_id'])
+            self._record('put', 'vertex', properties['_id'],
+                         dict(properties))
+            return Vertex(self, properties['_id'], properties)
 
-    def getVertex(self, _id):
+    def getVertex(self, _id, lazy=False, properties=None):
         """Retrieves an existing vertex from the graph
         @params _id: Node unique identifier
+        @params lazy: If True, the vertex is not fetched (nor checked
+        for existence) until its properties are needed
+        @params properties: Optional list of the property keys fetched,
+        the other ones are loaded when first read
 
         @returns The requested Vertex or None"""
         try:
-            return Vertex(self, _id)
+            return self._getElement(Vertex, _id, lazy, properties)
         except RexsterException:
             return None
 
-    def getVertices(self):
-        """Returns an iterator with all the vertices"""
+    def _getMany(self, klass, ids, name, keys=None):
+        """Yields the elements with the given ids in order, or None for
+        the missing ones. A Gremlin request is issued per page of ids,
+        falling back to concurrent GETs if Gremlin is not available"""
+        ids = list(ids)
+        step = self.page_size or len(ids) or 1
+        for start in range(0, len(ids), step):
+            chunk = ids[start:start + step]
+            script = self.scripts[name]
+            content = self._gremlinOrNone(script.source, script.bind(chunk),
+                                          keys)
+            if content is None:
+                getter = self.getVertex if klass is Vertex else self.getEdge
+                for element in _fanout(lambda _id: getter(_id,
+                                                          properties=keys),
+                                       chunk, self.connection.pool_size):
+                    yield element
+            else:
+                for item in content['results']:
+                    if item:
+                        yield _element(klass, self, item, keys)
+                    else:
+                        yield None
+
+    def getVertices(self, ids=None, properties=None):
+        """Returns an iterator with all the vertices, requested in
+        pages of page_size vertices
+        @params ids: Optional list of node unique identifiers. When
+        given only those vertices are returned, in the same order and
+        with None for the missing ones
+        @params properties: Optional list of the property keys fetched,
+        the other ones are loaded when first read"""
+        if ids is not None:
+            for vertex in self._getMany(Vertex, ids, 'vertices', properties):
+                yield vertex
+            return
         url = "%s/vertices" % self.url
-        r = requests.get(url)
-        for vertex in simplejson.loads(r.content)['results']:
-            yield Vertex(self, vertex.get('_id'))
+        for vertex in self._paginate(url, properties):
+            yield _element(Vertex, self, vertex, properties)
+
+    def getVerticesTable(self, keys=()):
+        """Returns all the vertices in an ElementTable, requested in
+        pages of page_size vertices
+        @params keys: The property keys kept in the table
+
+        @returns The ElementTable"""
+        table = ElementTable(self, Vertex, keys)
+        for vertex in self._paginate("%s/vertices" % self.url,
+                                     _tableKeys(keys)):
+            table.append(vertex)
+        return table
+
+    def _scalar(self, name, *args):
+        """Executes a registered script returning a single value,
+        None if the server has no Gremlin extension"""
+        script = self.scripts[name]
+        content = self._gremlinOrNone(script.source, script.bind(*args))
+        if content is None:
+            return None
+        results = content['results']
+        if isinstance(results, list):
+            return results[0]
+        return results
+
+    def countVertices(self):
+        """Counts the vertices of the graph with Gremlin, or by paging
+        through their ids without it
+
+        @returns The number of vertices"""
+        count = self._scalar('count_vertices')
+        if count is None:
+            count = sum(1 for item in self._paginate(
+                "%s/vertices" % self.url, ['_id']))
+        return count
+
+    def countEdges(self):
+        """Counts the edges of the graph with Gremlin, or by paging
+        through their ids without it
+
+        @returns The number of edges"""
+        count = self._scalar('count_edges')
+        if count is None:
+            count = sum(1 for item in self._paginate(
+                "%s/edges" % self.url, ['_id']))
+        return count
+
+    def groupCount(self, key, klass=Vertex):
+        """Counts the vertices or edges by value of a property, with
+        Gremlin or by paging through that property without it
+        @params key: The property key
+        @params klass: Vertex or Edge
+
+        @returns A dict mapping each value, as decoded from JSON, to its
+        number of elements"""
+        kind = 'vertices' if klass is Vertex else 'edges'
+        script = self.scripts['group_count_%s' % kind]
+        # Counted as [value, count] pairs, since the keys of a JSON
+        # object would turn every value into a string
+        content = self._gremlinOrNone(script.source, script.bind(key))
+        if content is not None:
+            counts = dict((value, count)
+                          for value, count in content['results'])
+        else:
+            counts = {}
+            for item in self._paginate("%s/%s" % (self.url, kind), [key]):
+                value = item.get(key)
+                counts[value] = counts.get(value, 0) + 1
+        return counts
+
+    def snapshot(self, properties=(), edge_properties=(), weight=None,
+                 timestamp=None):
+        """Copies the whole graph into a GraphSnapshot, paging through
+        the vertices and edges with only the given keys
+        @params properties: Vertex property keys kept in the snapshot
+        @params edge_properties: Edge property keys kept in the snapshot
+        @params weight: Optional edge property used as the weight of
+        weighted shortest paths
+        @params timestamp: Optional property holding the time elements
+        were last changed, used by refresh() to pull the changes made
+        by other clients
+
+        @returns The GraphSnapshot"""
+        from rexster.snapshot import GraphSnapshot
+        position = None
+        if self.changes is not None:
+            position = len(self.changes)
+        vertex_keys, edge_keys = _snapshotKeys(properties, edge_properties,
+                                               weight, timestamp)
+        vertices = self._paginate("%s/vertices" % self.url,
+                                  vertex_keys or ['_id'])
+        edges = self._paginate("%s/edges" % self.url, edge_keys or ['_id'])
+        snapshot = GraphSnapshot(vertices, edges, properties,
+                                 edge_properties, weight, timestamp)
+        snapshot.position = position
+        if self.changes is not None:
+            self.changes.follow(snapshot)
+        return snapshot
+
+    def export(self, path):
+        """Writes every vertex and edge of the graph, page by page, to a
+        line-delimited GraphSON file, see rexster.graphson
+        @params path: The file written
+
+        @returns The (vertices, edges) counts"""
+        from rexster import graphson
+        return graphson.export(self, path)
+
+    def import_(self, path, chunk_size=1000, workers=None, checkpoint=None):
+        """Adds the vertices and edges of a file written by export(),
+        with a batch request per chunk, see rexster.graphson
+        @params path: The file read
+        @params chunk_size: Number of elements per request
+        @params workers: Number of concurrent requests, by default the
+        size of the connection pool
+        @params checkpoint: Optional file recording the progress, from
+        which an interrupted import resumes
+
+        @returns The number of elements written"""
+        from rexster import graphson
+        return graphson.import_(self, path, chunk_size, workers, checkpoint)
+
+    def _changedSince(self, kind, key, since, keys):
+        """Yields the property maps of the vertices or edges whose key
+        property is at least since, with Gremlin or by paging through
+        the listing without it"""
+        script = self.scripts['changed_%s' % kind]
+        content = self._gremlinOrNone(script.source,
+                                      script.bind(key, since), keys)
+        if content is not None:
+            items = content['results']
+        else:
+            items = self._paginate("%s/%s" % (self.url, kind), keys)
+        for item in items:
+            if item.get(key) is not None and item.get(key) >= since:
+                yield item
+
+    def refresh(self, snapshot):
+        """Brings a snapshot up to date without downloading it again.
+        The changes made through the graph since the snapshot was
+        taken are replayed, which requires trackChanges() to be called
+        before taking it. Then, if the snapshot has a timestamp
+        property, the vertices and edges changed since its latest
+        timestamp are pulled. Removals made by other clients are not
+        seen, as they leave no timestamp
+        @params snapshot: A GraphSnapshot of this graph
+
+        @returns The number of changes applied"""
+        changes = []
+        if self.changes is not None and snapshot.position is not None:
+            changes.extend(self.changes.since(snapshot.position))
+            snapshot.position += len(changes)
+            self.changes.compact()
+        if snapshot.timestamp is not None and snapshot.since is not None:
+            vertex_keys, edge_keys = _snapshotKeys(
+                snapshot.properties, snapshot.edgeProperties,
+                snapshot.weight, snapshot.timestamp)
+            for kind, keys in (('vertices', vertex_keys),
+                               ('edges', edge_keys)):
+                for item in self._changedSince(kind, snapshot.timestamp,
+                                               snapshot.since, keys):
+                    changes.append(('put', 'vertex' if kind == 'vertices'
+                                    else 'edge', item['_id'], item))
+        snapshot.apply(changes)
+        return len(changes)
 
     def removeVertex(self, vertex):
         """Removes the given vertex
         @params vertex: Node to be removed"""
         _id = vertex.getId()
         url = "%s/vertices/%s" % (self.url, _id)
-        r = requests.delete(url)
+        r = self.connection.delete(url)
         if r.error:
             raise RexsterException("Could not delete vertex")
+        self._mutated()
+        self._record('remove', 'vertex', _id)
+        if self.cache is not None:
+            self.cache.invalidate(url)
+            self.cache.invalidateEdgesOf(vertex)
 
     def addEdge(self, outV, inV, label):
         """Creates a new edge
@@ -282,30 +1848,52 @@ class RexsterGraph(object):
         data = dict(_outV=outV.getId(),
                     _inV=inV.getId(),
                     _label=label)
-        r = requests.post(url, data=data)
+        r = self.connection.post(url, data=data)
         if r.error:
             raise RexsterException("Could not create the edge")
+        self._mutated()
         properties = simplejson.loads(r.content)['results']
-        return Edge(self, properties['_id'])
-
-    def getEdges(self):
-        """Returns an iterator with all the edges"""
+        self._record('put', 'edge', properties['_id'], dict(properties))
+        return Edge(self, properties['_id'], properties)
+
+    def getEdges(self, ids=None, properties=None):
+        """Returns an iterator with all the edges, requested in
+        pages of page_size edges
+        @params ids: Optional list of edge unique identifiers. When
+        given only those edges are returned, in the same order and
+        with None for the missing ones
+        @params properties: Optional list of the property keys fetched,
+        the other ones are loaded when first read"""
+        if ids is not None:
+            for edge in self._getMany(Edge, ids, 'edges', properties):
+                yield edge
+            return
         url = "%s/edges" % self.url
-        r = requests.get(url)
-        content = simplejson.loads(r.content)
-        if r.error:
-            raise RexsterException(content['message'])
-        else:
-            for edge in content['results']:
-                yield Edge(self, edge.get('_id'))
+        for edge in self._paginate(url, properties):
+            yield _element(Edge, self, edge, properties)
 
-    def getEdge(self, _id):
+    def getEdgesTable(self, keys=('_label', '_outV', '_inV')):
+        """Returns all the edges in an ElementTable, requested in pages
+        of page_size edges
+        @params keys: The property keys kept in the table
+
+        @returns The ElementTable"""
+        table = ElementTable(self, Edge, keys)
+        for edge in self._paginate("%s/edges" % self.url, _tableKeys(keys)):
+            table.append(edge)
+        return table
+
+    def getEdge(self, _id, lazy=False, properties=None):
         """Retrieves an existing edge from the graph
         @params _id: Edge unique identifier
+        @params lazy: If True, the edge is not fetched (nor checked
+        for existence) until its properties are needed
+        @params properties: Optional list of the property keys fetched,
+        the other ones are loaded when first read
 
         @returns The requested Edge"""
         try:
-            return Edge(self, _id)
+            return self._getElement(Edge, _id, lazy, properties)
         except RexsterException:
             return None
 
@@ -314,21 +1902,135 @@ class RexsterGraph(object):
         @params edge: The edge to be removed"""
         _id = edge.getId()
         url = "%s/edges/%s" % (self.url, _id)
-        r = requests.delete(url)
+        r = self.connection.delete(url)
         if r.error:
             raise RexsterException("Could not delete edge")
+        self._mutated()
+        self._record('remove', 'edge', _id)
+        if self.cache is not None:
+            self.cache.invalidate(url)
+
+    def removeVertices(self, vertices):
+        """Removes the given vertices concurrently on the graph executor
+        @params vertices: Iterable of nodes to be removed
+
+        @returns A BulkResult collecting the errors of each removal"""
+        return self.executor.map(self.removeVertex, vertices)
+
+    def removeEdges(self, edges):
+        """Removes the given edges concurrently on the graph executor
+        @params edges: Iterable of edges to be removed
 
-    def gremlin_execute(self, gremlin_script):
+        @returns A BulkResult collecting the errors of each removal"""
+        return self.executor.map(self.removeEdge, edges)
+
+    def batch(self, size=1000):
+        """Returns a Batch buffering mutations on this graph, to be
+        used as a context manager
+        @params size: Number of buffered operations triggering a flush
+
+        @returns The Batch object"""
+        return Batch(self, size)
+
+    def _gremlinRequest(self, gremlin_script, params, keys=None, **kwargs):
         url = '%s/tp/gremlin' % (self.url)
-        r = requests.post(url, data={'script':gremlin_script})
+        if params is None and keys is None:
+            return self.connection.post(url, data={'script': gremlin_script},
+                                        **kwargs)
+        data = {'script': gremlin_script, 'params': params or {}}
+        if keys is not None:
+            data['rexster'] = {'returnKeys': list(keys)}
+        data = simplejson.dumps(data)
+        return self.connection.post(url, data=data,
+            headers={'Content-Type': 'application/json'}, **kwargs)
+
+    def _gremlinOrNone(self, gremlin_script, params, keys=None):
+        """Executes a Gremlin script, returning None instead of the
+        decoded response if the server has no Gremlin extension"""
+        if self._gremlin is False:
+            return None
+        r = self._gremlinRequest(gremlin_script, params, keys)
+        if r.status_code == 404:
+            self._gremlin = False
+            return None
+        self._gremlin = True
+        content = simplejson.loads(r.content)
+        if r.error:
+            raise RexsterException(content['message'])
+        return content
+
+    def traverse(self, start):
+        """Starts a multi-hop traversal
+        @params start: Vertex objects or ids the traversal starts from
+
+        @returns A Traversal object"""
+        return Traversal(self, start)
+
+    def gremlin_execute(self, gremlin_script, params=None, cache=False):
+        """Executes a Gremlin script on the graph
+        @params gremlin_script: The script source
+        @params params: Optional dict of variables bound in the script
+        @params cache: When the graph has a query_cache, whether the
+        result may be taken from and stored in it. Only pass True for
+        read-only scripts: by default the script may change the graph
+        and the cache is cleared
+
+        @returns The decoded server response"""
+        query_cache = self.query_cache
+        if query_cache is not None and cache:
+            content = query_cache.get(gremlin_script, params)
+            if content is not None:
+                return content
+        r = self._gremlinRequest(gremlin_script, params)
+        content = None
         if r.content:
             content = simplejson.loads(r.content)
 
+        if not cache:
+            self._mutated()
         if r.error:
             raise RexsterException(content['message'])
         elif content:
+            if query_cache is not None and cache:
+                query_cache.put(gremlin_script, params, r.content)
             return content
 
+    def gremlin_stream(self, gremlin_script, params=None):
+        """Executes a Gremlin script on the graph, yielding the items
+        of its results while the response is being decoded
+        @params gremlin_script: The script source
+        @params params: Optional dict of variables bound in the script
+
+        @returns A generator over the results"""
+        r = self._gremlinRequest(gremlin_script, params, prefetch=False)
+        return _iterResults(r)
+
+    def registerScript(self, name, source, params=(), mutates=False):
+        """Registers a named Gremlin script for execute()
+        @params name: The name the script is invoked by
+        @params source: The Gremlin source
+        @params params: Names of the parameters the script expects
+        @params mutates: Whether the script changes the graph, in which
+        case its results are never cached
+
+        @returns The GremlinScript object"""
+        script = GremlinScript(source, params, mutates)
+        self.scripts[name] = script
+        return script
+
+    def execute(self, name, *args, **kwargs):
+        """Executes a registered Gremlin script, binding the given
+        values, by position or by name, to its parameters
+        @params name: The name the script was registered with
+
+        @returns The decoded server response"""
+        script = self.scripts.get(name)
+        if script is None:
+            raise RexsterException("Unknown Gremlin script %s" % name)
+        return self.gremlin_execute(script.source,
+                                    script.bind(*args, **kwargs),
+                                    cache=not script.mutates)
+
     # attention: gremlin must be enabled        
     def shortest_path(self, start, end):
         if type(start) != Vertex or type(end) != Vertex:
@@ -343,11 +2045,316 @@ class RexsterGraph(object):
 #        gremlin_script = 'dsp.getPath(g.v(%d),g.v(%d))' % (start.getId(), end.getId())
 #        gremlin_result = self.gremlin_execute(gremlin_script)['results']
 
-        gremlin_script = '(new edu.uci.ics.jung.algorithms.shortestpath.DijkstraShortestPath(new GraphJung(g))).getPath(g.v(%d),g.v(%d))' % (start.getId(), end.getId())
-        gremlin_result = self.gremlin_execute(gremlin_script)['results']
+        gremlin_result = self.execute('shortest_path', start.getId(),
+                                      end.getId())['results']
 
         for edge in gremlin_result:
-            yield Edge(self, edge.get('_id'))
+            yield Edge(self, edge.get('_id'), edge)
+
+class Traversal(object):
+    """A multi-hop walk over the graph, built step by step from
+    RexsterGraph.traverse(). Each hop expands the whole frontier at
+    once, either in a single Gremlin request or with concurrent
+    requests per distinct frontier vertex"""
+
+    def __init__(self, graph, start):
+        self.graph = graph
+        self.start = list(start)
+        self.steps = []
+
+    def _hop(self, direction, labels, depth):
+        for i in range(depth):
+            self.steps.append(('hop', direction, labels))
+        return self
+
+    def out(self, *labels, **kwargs):
+        """Moves to the vertices at the head of the outgoing edges
+        @params labels: Optional edge labels to follow
+        @params depth: Number of times the hop is repeated, 1 by default"""
+        return self._hop('out', labels, kwargs.get('depth', 1))
+
+    def in_(self, *labels, **kwargs):
+        """Moves to the vertices at the tail of the incoming edges
+        @params labels: Optional edge labels to follow
+        @params depth: Number of times the hop is repeated, 1 by default"""
+        return self._hop('in', labels, kwargs.get('depth', 1))
+
+    def both(self, *labels, **kwargs):
+        """Moves to the vertices adjacent in any direction
+        @params labels: Optional edge labels to follow
+        @params depth: Number of times the hop is repeated, 1 by default"""
+        return self._hop('both', labels, kwargs.get('depth', 1))
+
+    def filter(self, function=None, **properties):
+        """Keeps the vertices having the given property values and, if
+        a function is given, for which it returns True. Traversals with
+        a function filter cannot be compiled to Gremlin"""
+        self.steps.append(('filter', function, properties))
+        return self
+
+    def dedup(self):
+        """Drops the vertices already seen"""
+        self.steps.append(('dedup',))
+        return self
+
+    def limit(self, count):
+        """Keeps the first count vertices"""
+        self.steps.append(('limit', count))
+        return self
+
+    def compile(self):
+        """Translates the traversal to a single Gremlin script whose
+        values are bound parameters, so traversals of the same shape
+        share the script source
+
+        @returns A (source, params) tuple, or None if a step cannot be
+        expressed in Gremlin"""
+        source = ['ids.collect{ g.v(it) }.findAll{ it != null }._()']
+        params = {'ids': [vertex.getId() if isinstance(vertex, Vertex)
+                          else vertex for vertex in self.start]}
+        for step in self.steps:
+            if step[0] == 'hop':
+                name = 'p%d' % len(params)
+                params[name] = list(step[2])
+                source.append('.%s(*%s)' % (step[1], name))
+            elif step[0] == 'filter':
+                if step[1] is not None:
+                    return None
+                for key, value in sorted(step[2].items()):
+                    names = ('p%d' % len(params), 'p%d' % (len(params) + 1))
+                    params[names[0]], params[names[1]] = key, value
+                    source.append('.has(%s, %s)' % names)
+            elif step[0] == 'dedup':
+                source.append('.dedup()')
+            elif step[0] == 'limit':
+                name = 'p%d' % len(params)
+                params[name] = step[1]
+                source.append('[0..<%s]' % name)
+        return ''.join(source), params
+
+    def _expand(self, direction, labels, frontier):
+        workers = self.graph.connection.pool_size
+        unique = dict((vertex.getId(), vertex) for vertex in frontier)
+
+        def adjacent(vertex):
+            results = []
+            for label in labels or (None,):
+                results.extend(vertex._adjacency(direction, label))
+            return results
+
+        ids = list(unique)
+        results = _fanout(lambda _id: adjacent(unique[_id]), ids, workers)
+        adjacency = dict(zip(ids, results))
+        return [Vertex(self.graph, item.get('_id'), item)
+                for vertex in frontier
+                for item in adjacency[vertex.getId()]]
+
+    def _matches(self, vertex, function, properties):
+        for key, value in properties.items():
+            if vertex.properties.get(key) != value:
+                return False
+        return function is None or function(vertex)
+
+    def _execute(self):
+        frontier = [vertex if isinstance(vertex, Vertex) else
+                    Vertex(self.graph, vertex, lazy=True)
+                    for vertex in self.start]
+        for step in self.steps:
+            if step[0] == 'hop':
+                frontier = self._expand(step[1], step[2], frontier)
+            elif step[0] == 'filter':
+                frontier = [vertex for vertex in frontier
+                            if self._matches(vertex, step[1], step[2])]
+            elif step[0] == 'dedup':
+                seen = set()
+                unique = []
+                for vertex in frontier:
+                    if vertex.getId() not in seen:
+                        seen.add(vertex.getId())
+                        unique.append(vertex)
+                frontier = unique
+            elif step[0] == 'limit':
+                frontier = frontier[:step[1]]
+        return frontier
+
+    def execute(self, gremlin=None):
+        """Runs the traversal
+        @params gremlin: True to run it as a single Gremlin script,
+        False to expand each hop with concurrent REST requests, None
+        to use Gremlin when the traversal compiles and the server
+        supports it
+
+        @returns The list of reached vertices"""
+        compiled = None
+        if gremlin is not False:
+            compiled = self.compile()
+            if compiled is None and gremlin:
+                raise RexsterException("The traversal cannot be compiled")
+        if compiled is not None:
+            if gremlin:
+                content = self.graph.gremlin_execute(*compiled, cache=True)
+            else:
+                content = self.graph._gremlinOrNone(*compiled)
+            if content is not None:
+                return [Vertex(self.graph, item.get('_id'), item)
+                        for item in content['results']]
+        return self._execute()
+
+    def __iter__(self):
+        return iter(self.execute())
+
+
+class BatchElement(object):
+    """A vertex or edge created through a Batch. Its id is known
+    once the batch has been flushed"""
+
+    def __init__(self, batch, kind, position):
+        self.batch = batch
+        self.kind = kind
+        self._flush = batch._flushes
+        self._position = position
+        self._id = None
+
+    def getId(self):
+        """Returns the unique identifier of the created element, or
+        None if the batch has not been flushed yet"""
+        return self._id
+
+    def element(self):
+        """Returns the created Vertex or Edge, without fetching it
+
+        @returns A lazy Vertex or Edge object"""
+        if self._id is None:
+            raise RexsterException("The batch has not been flushed yet")
+        if self.kind == 'vertex':
+            return Vertex(self.batch.graph, self._id, lazy=True)
+        return Edge(self.batch.graph, self._id, lazy=True)
+
+
+class Batch(object):
+    """An class buffering vertex and edge creations and property
+    updates, sent to the server in a single Gremlin request per
+    flush. Gremlin must be enabled in the server"""
+
+    def __init__(self, graph, size=1000):
+        """Creates a new batch
+        @params graph: The graph the mutations are applied to
+        @params size: Number of buffered operations triggering a flush"""
+        self.graph = graph
+        self.size = size
+        self._flushes = 0
+        self._operations = []
+        self._created = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def _reference(self, element):
+        if isinstance(element, BatchElement):
+            if element._id is None and element._flush == self._flushes:
+                return ['new', element._position]
+            if element._id is None:
+                raise RexsterException("Element of a failed batch")
+            return [element.kind, element._id]
+        if isinstance(element, Vertex):
+            return ['vertex', element.getId()]
+        if isinstance(element, Edge):
+            return ['edge', element.getId()]
+        raise RexsterException("Unknown element type")
+
+    def _append(self, operation, created=None):
+        self._operations.append(operation)
+        if created is not None:
+            self._created.append(created)
+        if len(self._operations) >= self.size:
+            self.flush()
+        return created
+
+    def addVertex(self, properties=None, _id=None):
+        """Buffers the creation of a vertex
+        @params properties: Optional dict of properties of the vertex
+        @params _id: Optional node unique identifier
+
+        @returns A BatchElement for the vertex"""
+        vertex = BatchElement(self, 'vertex', len(self._created))
+        return self._append(['vertex', _id, properties or {}], vertex)
+
+    def addEdge(self, outV, inV, label, properties=None):
+        """Buffers the creation of an edge
+        @params outV: Edge origin Vertex or BatchElement
+        @params inV: Edge target Vertex or BatchElement
+        @params label: Edge label
+        @params properties: Optional dict of properties of the edge
+
+        @returns A BatchElement for the edge"""
+        edge = BatchElement(self, 'edge', len(self._created))
+        operation = ['edge', None, self._reference(outV),
+                     self._reference(inV), label, properties or {}]
+        return self._append(operation, edge)
+
+    def setProperty(self, element, key, value):
+        """Buffers setting a property of an element
+        @params element: Vertex, Edge or BatchElement
+        @params key: The property key to set
+        @params value: The value to set"""
+        self._append(['property', self._reference(element), key, value])
+
+    def _record(self, operations, ids):
+        """Records the flushed operations in the graph change log"""
+        kinds = [operation[0] for operation in operations
+                 if operation[0] != 'property']
+
+        def resolve(ref):
+            if ref[0] == 'new':
+                return kinds[ref[1]], ids[ref[1]]
+            return ref[0], ref[1]
+
+        created = iter(ids)
+        for operation in operations:
+            if operation[0] == 'vertex':
+                properties = dict(operation[2], _id=next(created))
+                self.graph._record('put', 'vertex', properties['_id'],
+                                   properties)
+            elif operation[0] == 'edge':
+                properties = dict(operation[5], _id=next(created),
+                                  _outV=resolve(operation[2])[1],
+                                  _inV=resolve(operation[3])[1],
+                                  _label=operation[4])
+                self.graph._record('put', 'edge', properties['_id'],
+                                   properties)
+            else:
+                kind, _id = resolve(operation[1])
+                self.graph._record('put', kind, _id,
+                                   {operation[2]: operation[3]})
+
+    def flush(self):
+        """Sends the buffered operations to the server
+
+        @returns The list of ids of the elements created"""
+        operations, created = self._operations, self._created
+        self._operations, self._created = [], []
+        self._flushes += 1
+        if not operations:
+            return []
+        content = self.graph.execute('batch', operations)
+        ids = content['results']
+        for element, _id in zip(created, ids):
+            element._id = _id
+        if self.graph.changes is not None:
+            self._record(operations, ids)
+        if self.graph.cache is not None:
+            for operation in operations:
+                if operation[0] == 'property' and operation[1][0] != 'new':
+                    kind, _id = operation[1]
+                    klass = Vertex if kind == 'vertex' else Edge
+                    self.graph.cache.invalidate("%s/%s/%s" % (
+                        self.graph.url, klass.PATH, _id))
+        return ids
+
 
 class Index(object):
     """An class containing all the methods needed by an
@@ -375,8 +2382,8 @@ class Index(object):
 
         @returns The number of elements indexed"""
         url = "%s/count" % self.url
-        r = requests.get(url, params={'key': key,
-                                    'value': value})
+        r = self.graph.connection.get(url, params={'key': key,
+                                                   'value': value})
         content = simplejson.loads(r.content)
         if r.error:
             raise RexsterException(content['message'])
@@ -416,27 +2423,29 @@ class Index(object):
                 'value': value,
                 'class': klass,
                 'id': element.getId()}
-        r = requests.post(self.url, data)
+        r = self.graph.connection.post(self.url, data)
         if r.error:
             error_msg = simplejson.loads(r.content)['message']
             raise RexsterException(error_msg)
+        self.graph._mutated()
 
-    def get(self, key, value):
+    def get(self, key, value, properties=None):
         """Gets an element from an index under a given
         key-value pair
         @params key: Index key string
         @params value: Index value string
+        @params properties: Optional list of the property keys fetched,
+        the other ones are loaded when first read
         @returns A generator of Vertex or Edge objects"""
-        r = requests.get(self.url, params={'key': key,
-                                        'value': value})
-        content = simplejson.loads(r.content)
-        if r.error:
-            raise RexsterException(content['message'])
-        for item in content['results']:
+        params = {'key': key, 'value': value}
+        params.update(_returnKeys(properties) or {})
+        r = self.graph.connection.get(self.url, params=params,
+                                      prefetch=False)
+        for item in _iterResults(r):
             if self.indexClass in ('vertex', 'neo4jvertex'):
-                yield Vertex(self.graph, item.get('_id'))
+                yield _element(Vertex, self.graph, item, properties)
             else:
-                yield Edge(self.graph, item.get('_id'))
+                yield _element(Edge, self.graph, item, properties)
 
     def remove(self, key, value, element):
         """Removes an element from an index under a given
@@ -452,9 +2461,72 @@ class Index(object):
             raise RexsterException("Unknown element to be deleted")
         _id = element.getId()
         data = {'class': klass, 'key': key, 'value': value, 'id': _id}
-        r = requests.delete(self.url, params=data)
+        r = self.graph.connection.delete(self.url, params=data)
         if r.error:
             raise RexsterException("Could not delete element")
+        self.graph._mutated()
+
+    def _entry(self, key, value, element):
+        if isinstance(element, Vertex):
+            return [key, value, 'vertex', element.getId()]
+        elif isinstance(element, Edge):
+            return [key, value, 'edge', element.getId()]
+        raise RexsterException("Unknown element type")
+
+    def _chunks(self, items):
+        items = list(items)
+        step = self.graph.page_size or len(items) or 1
+        for start in range(0, len(items), step):
+            yield items[start:start + step]
+
+    def _bulk(self, script, single, entries):
+        entries = [tuple(entry) for entry in entries]
+        for chunk in self._chunks(entries):
+            source = self.graph.scripts[script]
+            params = source.bind(self.indexName,
+                                 [self._entry(*entry) for entry in chunk])
+            if self.graph._gremlinOrNone(source.source, params) is None:
+                self.graph.executor.map(lambda entry: single(*entry),
+                                        chunk).check()
+            self.graph._mutated()
+
+    def put_many(self, entries):
+        """Puts many elements in the index, with a Gremlin request
+        per page of entries or concurrent requests without Gremlin
+        @params entries: Iterable of (key, value, element) tuples"""
+        self._bulk('index_put', self.put, entries)
+
+    def remove_many(self, entries):
+        """Removes many elements from the index, with a Gremlin request
+        per page of entries or concurrent requests without Gremlin
+        @params entries: Iterable of (key, value, element) tuples"""
+        self._bulk('index_remove', self.remove, entries)
+
+    def get_many(self, pairs):
+        """Gets the elements indexed under many key-value pairs, with
+        a Gremlin request per page of pairs or concurrent requests
+        without Gremlin
+        @params pairs: Iterable of (key, value) tuples
+
+        @returns A list with the list of Vertex or Edge objects of
+        each pair, in the order of the pairs"""
+        if self.indexClass in ('vertex', 'neo4jvertex'):
+            klass = Vertex
+        else:
+            klass = Edge
+        results = []
+        for chunk in self._chunks([list(pair) for pair in pairs]):
+            script = self.graph.scripts['index_get']
+            content = self.graph._gremlinOrNone(
+                script.source, script.bind(self.indexName, chunk))
+            if content is None:
+                results.extend(self.graph.executor.map(
+                    lambda pair: list(self.get(*pair)), chunk).check())
+                continue
+            for items in content['results']:
+                results.append([klass(self.graph, item.get('_id'), item)
+                                for item in items])
+        return results
 
     def __str__(self):
         return "Index %s (%s, %s)" % (self.indexName,
@@ -466,7 +2538,7 @@ class AutomaticIndex(Index):
 
     def getAutoIndexKeys(self):
         url = "%s/keys" % self.url
-        r = requests.get(url)
+        r = self.graph.connection.get(url)
         content = simplejson.loads(r.content)
         if r.error:
             raise RexsterException(content['message'])
@@ -487,11 +2559,12 @@ class RexsterIndexableGraph(RexsterGraph):
         if indexType == 'automatic':
             data['keys'] = autoKeys
         print data
-        r = requests.post(url, data=data)
+        r = self.connection.post(url, data=data)
         content = simplejson.loads(r.content)
         if r.error:
             raise RexsterException(content['message'])
         print content
+        self._mutated()
         return content['results']
 
     def createManualIndex(self, indexName, indexClass):
@@ -513,16 +2586,17 @@ class RexsterIndexableGraph(RexsterGraph):
         if indexClass != 'vertex' and indexClass != 'edge':
             raise RexsterException("%s is not a valid indexClass" % indexClass)
         url = "%s/keyindices/%s/%s" % (self.url, indexClass, autoKey)
-        r = requests.post(url)
+        r = self.connection.post(url)
         if r.error:          
           raise RexsterException('Key Index create error !')
+        self._mutated()
 
     def getIndices(self):
         """Returns a generator function over all the existing indexes
 
         @returns A generator function over all rhe Index objects"""
         url = "%s/indices" % self.url
-        r = requests.get(url)
+        r = self.connection.get(url)
         content = simplejson.loads(r.content)
         if r.error:
             raise RexsterException(content['message'])
@@ -536,11 +2610,11 @@ class RexsterIndexableGraph(RexsterGraph):
 
         @return The Index object or None"""
         url = "%s/indices/%s" % (self.url, indexName)
-        r = requests.get(url)
-        #rexster 0.4 content = simplejson.loads(r.content)
-        content = simplejson.loads(r.content)['results'] #rexster 0.5
+        r = self.connection.get(url)
         if r.error:
             return None
+        #rexster 0.4 content = simplejson.loads(r.content)
+        content = simplejson.loads(r.content)['results'] #rexster 0.5
         if content['type'] == 'automatic':
             return AutomaticIndex(self, content['name'],
                                 content['class'], content['type'])
@@ -552,7 +2626,8 @@ class RexsterIndexableGraph(RexsterGraph):
         """Removes an index with a given indexName
         @params indexName: The index name"""
         url = "%s/indices/%s" % (self.url, indexName)
-        r = requests.delete(url)
+        r = self.connection.delete(url)
         if r.error:
             content = simplejson.loads(r.content)
             raise RexsterException(content['message'])
+        self._mutated()
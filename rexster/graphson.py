@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+"""Line-delimited GraphSON dumps of whole graphs.
+
+A dump holds one JSON property map per line, as returned by Rexster:
+every vertex first, then every edge. RexsterGraph.export() writes it page
+by page and RexsterGraph.import_() reads it back in chunks, so neither
+holds more than a page or a few chunks in memory, besides the ids of the
+vertices the target server did not keep:
+
+>>> graph.export('backup.json')
+>>> target.import_('backup.json', chunk_size=1000, workers=4,
+...                checkpoint='backup.checkpoint')
+
+The checkpoint file records the lines of every chunk written, along with
+the ids the target server gave to vertices whose id it did not keep. An
+import given the same checkpoint skips the recorded lines, so it only
+writes again the chunks that failed or were not reached.
+"""
+
+import os
+from itertools import islice
+
+import simplejson
+
+from rexster import RexsterException, Vertex
+
+
+def export(graph, path):
+    """Writes every vertex and edge of a graph to a dump
+    @params graph: The RexsterGraph
+    @params path: The file written
+
+    @returns The (vertices, edges) counts"""
+    counts = []
+    with open(path, 'w') as dump:
+        for kind in ('vertices', 'edges'):
+            count = 0
+            for item in graph._paginate("%s/%s" % (graph.url, kind)):
+                dump.write(simplejson.dumps(item))
+                dump.write('\n')
+                count += 1
+            counts.append(count)
+    return tuple(counts)
+
+
+def _properties(item):
+    return dict((key, value) for key, value in item.items()
+                if not key.startswith('_'))
+
+
+def _readCheckpoint(path):
+    """Returns the sorted line ranges written and the id map of a
+    checkpoint"""
+    ranges, ids = [], {}
+    if path is None or not os.path.exists(path):
+        return ranges, ids
+    with open(path) as checkpoint:
+        for entry in checkpoint:
+            entry = simplejson.loads(entry)
+            ranges.extend(entry['lines'])
+            ids.update(entry['ids'])
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return merged, ids
+
+
+def _remaining(dump, written):
+    """Yields the (line number, item) pairs of a dump outside the
+    written line ranges"""
+    line = 0
+    for first, last in written:
+        for text in islice(dump, first - line):
+            yield line, simplejson.loads(text)
+            line += 1
+        for text in islice(dump, last - first):
+            pass
+        line = last
+    for text in dump:
+        yield line, simplejson.loads(text)
+        line += 1
+
+
+def _ranges(lines):
+    """Returns the [first, last) ranges covering sorted line numbers"""
+    ranges = []
+    for line in lines:
+        if ranges and ranges[-1][1] == line:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([line, line + 1])
+    return ranges
+
+
+class _Importer(object):
+    """Writes the chunks of a dump to a graph"""
+
+    def __init__(self, graph, ids):
+        self.graph = graph
+        self.ids = ids
+
+    def _vertex(self, _id):
+        return self.ids.get(unicode(_id), _id)
+
+    def write(self, chunk):
+        """Writes a chunk of vertices or of edges in a single batch
+        request, or element by element without Gremlin
+
+        @returns The dict of vertex ids changed by the server"""
+        ops = []
+        for item in chunk:
+            if item.get('_type') == 'edge':
+                ops.append(['edge', item['_id'],
+                            ['vertex', self._vertex(item['_outV'])],
+                            ['vertex', self._vertex(item['_inV'])],
+                            item['_label'], _properties(item)])
+            else:
+                ops.append(['vertex', item['_id'], _properties(item)])
+        script = self.graph.scripts['batch']
+        content = self.graph._gremlinOrNone(script.source, script.bind(ops))
+        if content is None:
+            created = [self._single(op) for op in ops]
+        else:
+            created = content['results']
+        self.graph._mutated()
+        changed = {}
+        for op, _id in zip(ops, created):
+            if op[0] == 'vertex' and unicode(_id) != unicode(op[1]):
+                changed[unicode(op[1])] = _id
+            self._record(op, _id)
+        return changed
+
+    def _single(self, op):
+        graph = self.graph
+        if op[0] == 'vertex':
+            element = graph.addVertex(op[1])
+            properties = op[2]
+        else:
+            element = graph.addEdge(Vertex(graph, op[2][1], lazy=True),
+                                    Vertex(graph, op[3][1], lazy=True),
+                                    op[4])
+            properties = op[5]
+        if properties:
+            element.setProperties(properties)
+        return element.getId()
+
+    def _record(self, op, _id):
+        if op[0] == 'vertex':
+            properties = dict(op[2], _id=_id)
+        else:
+            properties = dict(op[5], _id=_id, _outV=op[2][1],
+                              _inV=op[3][1], _label=op[4])
+        self.graph._record('put', op[0], _id, properties)
+
+
+def import_(graph, path, chunk_size=1000, workers=None, checkpoint=None):
+    """Writes the vertices and edges of a dump to a graph, with a
+    batch request per chunk and up to workers chunks at a time
+    @params graph: The RexsterGraph written to
+    @params path: The dump read
+    @params chunk_size: Number of elements per request
+    @params workers: Number of concurrent requests, by default the
+    size of the connection pool
+    @params checkpoint: Optional file recording the progress, from
+    which a later call resumes
+
+    @returns The number of elements written"""
+    workers = workers or graph.connection.pool_size
+    done, ids = _readCheckpoint(checkpoint)
+    importer = _Importer(graph, ids)
+    written = 0
+    with open(path) as dump:
+        items = _remaining(dump, done)
+        pending = None
+        while True:
+            wave, kind = [], None
+            while len(wave) < workers:
+                if pending is not None:
+                    chunk, pending = pending, None
+                else:
+                    chunk = list(islice(items, chunk_size))
+                    if not chunk:
+                        break
+                # Vertices are all written before the edges using them
+                edges = [item.get('_type') == 'edge' for line, item in chunk]
+                if edges != sorted(edges):
+                    raise RexsterException("Vertices must come before "
+                                           "edges in %s" % path)
+                if edges[0] != edges[-1]:
+                    split = edges.index(True)
+                    chunk, pending = chunk[:split], chunk[split:]
+                if kind is not None and kind != edges[0]:
+                    pending = chunk
+                    break
+                kind = edges[0]
+                wave.append(chunk)
+            if not wave:
+                break
+            result = graph.executor.map(
+                lambda chunk: importer.write([item for line, item in chunk]),
+                wave)
+            # Every chunk written is recorded, failed ones are written
+            # again by a resumed import
+            failed = set(index for index, chunk, e in result.errors)
+            entries = []
+            for index, chunk in enumerate(wave):
+                if index in failed:
+                    continue
+                changed = result.results[index]
+                ids.update(changed)
+                written += len(chunk)
+                entries.append({'lines': _ranges(line for line, item
+                                                 in chunk),
+                                'ids': changed})
+            if checkpoint is not None and entries:
+                with open(checkpoint, 'a') as progress:
+                    for entry in entries:
+                        progress.write(simplejson.dumps(entry))
+                        progress.write('\n')
+            result.check()
+    return written
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+"""Cooperative variant of the client for high-concurrency workloads.
+
+Python 2 has no asyncio, so concurrency comes from gevent greenlets.
+gevent must patch the standard library before requests is imported,
+after that every request of the client yields to other greenlets while
+waiting on the network:
+
+>>> from gevent import monkey; monkey.patch_all()
+>>> from rexster.green import GreenRexsterServer, GreenRexsterGraph
+>>> server = GreenRexsterServer('http://localhost:8182/graphs', 50)
+>>> graph = GreenRexsterGraph(server, 'tinkergraph')
+>>> edges = graph.map(lambda v: list(v.getOutEdges()), frontier)
+"""
+
+try:
+    import gevent
+    import gevent.pool
+    import gevent.queue
+except ImportError:
+    gevent = None
+
+from rexster import RexsterException, RexsterIndexableGraph, RexsterServer
+
+
+class GreenRexsterServer(RexsterServer):
+    """A RexsterServer whose graphs run their calls in a bounded
+    pool of greenlets"""
+
+    def __init__(self, host, concurrency=100, **kwargs):
+        """Connects to a Rexster server
+        @params host: The server URL
+        @params concurrency: Maximum number of concurrent requests
+        @params kwargs: RexsterConnection settings, see RexsterServer"""
+        if gevent is None:
+            raise RexsterException("gevent is required by rexster.green")
+        kwargs.setdefault('pool_size', concurrency)
+        super(GreenRexsterServer, self).__init__(host, **kwargs)
+        self.pool = gevent.pool.Pool(concurrency)
+
+
+class GreenRexsterGraph(RexsterIndexableGraph):
+    """A graph with the same methods as RexsterIndexableGraph, and
+    the Vertex, Edge and Index objects it returns, whose requests
+    are cooperative. The helpers below fan calls out over the
+    concurrency limit of the GreenRexsterServer"""
+
+    def spawn(self, func, *args, **kwargs):
+        """Runs a call in the server pool, waiting for a free slot
+        @params func: Any callable, e.g. a bound method of an element
+
+        @returns A greenlet, whose get() method returns the result"""
+        return self.server.pool.spawn(func, *args, **kwargs)
+
+    def map(self, func, iterable):
+        """Applies a callable to every item concurrently
+
+        @returns The list of results, in the order of the items"""
+        return self.server.pool.map(func, iterable)
+
+    def imap(self, func, iterable):
+        """Applies a callable to every item concurrently
+
+        @returns An iterator over the results, in the order of the
+        items"""
+        return self.server.pool.imap(func, iterable)
+
+    def stream(self, iterator, buffer_size=1000):
+        """Consumes an iterator, e.g. getVertices() or Index.get(), in
+        a greenlet of its own, so its requests overlap with the work
+        done on the elements already received. The greenlet is killed
+        when the returned iterator is closed or garbage collected
+        @params iterator: The iterator to consume
+        @params buffer_size: Maximum number of items read ahead
+
+        @returns An iterator over the same items"""
+        queue = gevent.queue.Queue(buffer_size)
+        done = object()
+
+        def produce():
+            try:
+                for item in iterator:
+                    queue.put((item, None))
+            except gevent.GreenletExit:
+                raise
+            except BaseException as e:
+                queue.put((done, e))
+            else:
+                queue.put((done, None))
+
+        # The producer only waits on the queue and the requests of the
+        # iterator, so it runs outside the pool instead of holding one
+        # of its slots, and is killed if the consumer stops early
+        producer = gevent.spawn(produce)
+        try:
+            while True:
+                item, error = queue.get()
+                if error is not None:
+                    raise error
+                if item is done:
+                    return
+                yield item
+        finally:
+            producer.kill()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+"""Request instrumentation for the client.
+
+Every request sent through a RexsterConnection is reported to its
+listeners as (method, endpoint, status, latency, size), where endpoint
+is the URL path with ids and names replaced by placeholders, e.g.
+'/tinkergraph/vertices/{id}/outE'. RequestStats is a listener keeping
+per-endpoint counts, errors, bytes and a latency histogram:
+
+>>> stats = RequestStats()
+>>> server.connection.addListener(stats)
+>>> stats.summary()
+"""
+
+import re
+import threading
+
+_ENDPOINT_PATTERNS = [
+    (re.compile(r'^[a-zA-Z]+://[^/]+'), ''),
+    (re.compile(r'\?.*$'), ''),
+    (re.compile(r'/(vertices|edges)/[^/]+'), r'/\1/{id}'),
+    (re.compile(r'/indices/[^/]+'), r'/indices/{name}'),
+    (re.compile(r'/keyindices/([^/]+)/[^/]+'), r'/keyindices/\1/{key}'),
+]
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+def endpointTemplate(url):
+    """Returns the path of a request URL with element ids and index
+    names replaced by placeholders
+    @params url: The request URL
+
+    @returns The endpoint template"""
+    for pattern, replacement in _ENDPOINT_PATTERNS:
+        url = pattern.sub(replacement, url)
+    return url or '/'
+
+
+class EndpointStats(object):
+    """Aggregated measures of the requests to one endpoint"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latency = 0.0
+        self.maxLatency = 0.0
+        self.histogram = [0] * len(BUCKETS)
+
+    def add(self, status, latency, size):
+        self.count += 1
+        if status is None or status >= 400:
+            self.errors += 1
+        self.bytes += size or 0
+        self.latency += latency
+        self.maxLatency = max(self.maxLatency, latency)
+        for index, bound in enumerate(BUCKETS):
+            if latency <= bound:
+                self.histogram[index] += 1
+                break
+
+    def percentile(self, q):
+        """Returns the upper bound of the histogram bucket holding
+        the q-th percentile of the latencies
+        @params q: Percentile between 0 and 100"""
+        if not self.count:
+            return None
+        rank = self.count * q / 100.0
+        seen = 0
+        for bound, hits in zip(BUCKETS, self.histogram):
+            seen += hits
+            if seen >= rank:
+                return min(bound, self.maxLatency)
+        return self.maxLatency
+
+    def errorRate(self):
+        if not self.count:
+            return 0.0
+        return float(self.errors) / self.count
+
+    def asDict(self):
+        return {'count': self.count,
+                'errors': self.errors,
+                'errorRate': self.errorRate(),
+                'bytes': self.bytes,
+                'mean': self.latency / self.count if self.count else None,
+                'p50': self.percentile(50),
+                'p95': self.percentile(95),
+                'p99': self.percentile(99),
+                'max': self.maxLatency}
+
+
+class RequestStats(object):
+    """A connection listener aggregating the requests in memory,
+    keyed by (method, endpoint template)"""
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, method, endpoint, status, latency, size):
+        with self._lock:
+            stats = self._endpoints.get((method, endpoint))
+            if stats is None:
+                stats = self._endpoints[(method, endpoint)] = EndpointStats()
+            stats.add(status, latency, size)
+
+    def get(self, method, endpoint):
+        """Returns the EndpointStats of an endpoint or None"""
+        return self._endpoints.get((method, endpoint))
+
+    def total(self):
+        """Returns the number of requests recorded"""
+        return sum(stats.count for stats in self._endpoints.values())
+
+    def summary(self):
+        """Returns a dict mapping "METHOD endpoint" to the measures
+        of the endpoint"""
+        with self._lock:
+            return dict(("%s %s" % key, stats.asDict())
+                        for key, stats in self._endpoints.items())
+
+    def reset(self):
+        """Forgets every recorded request"""
+        with self._lock:
+            self._endpoints.clear()
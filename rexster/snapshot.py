@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+"""Local, read-only copies of a graph for in-process analysis.
+
+RexsterGraph.snapshot() pages through every vertex and edge once and
+packs the adjacency in compressed sparse row (CSR) arrays: the edges of
+vertex i are edges[offsets[i]:offsets[i + 1]]. The arrays are
+array.array objects, so numpy.frombuffer() can wrap them without a
+copy. Queries then run without any request:
+
+>>> snapshot = graph.snapshot(properties=['name'], weight='weight')
+>>> snapshot.kHop(1, 2)
+>>> snapshot.shortestPath(1, 5, weighted=True)
+
+A snapshot is kept current by RexsterGraph.refresh(), which replays the
+changes made through the graph since the snapshot was taken and, when
+the snapshot has a timestamp property, pulls the elements changed by
+other clients since then.
+"""
+
+import heapq
+from array import array
+from collections import deque, OrderedDict
+
+from rexster import EdgeTuple, RexsterException
+
+DIRECTIONS = ('out', 'in', 'both')
+
+
+def _csr(size, sources, targets):
+    """Builds the CSR arrays of the edges grouped by source index
+
+    @returns The (offsets, targets, edges) arrays"""
+    offsets = array('l', [0] * (size + 1))
+    for source in sources:
+        offsets[source + 1] += 1
+    for index in range(size):
+        offsets[index + 1] += offsets[index]
+    position = array('l', offsets[:size])
+    adjacent = array('l', [0] * len(sources))
+    edges = array('l', [0] * len(sources))
+    for edge, (source, target) in enumerate(zip(sources, targets)):
+        adjacent[position[source]] = target
+        edges[position[source]] = edge
+        position[source] += 1
+    return offsets, adjacent, edges
+
+
+class GraphSnapshot(object):
+    """A copy of the vertices and edges of a graph taken at one point
+    in time, with ids mapped to dense indices. It only changes through
+    apply()"""
+
+    def __init__(self, vertices, edges, properties=(), edge_properties=(),
+                 weight=None, timestamp=None):
+        """Builds a snapshot from property maps as returned by the
+        server. Edges whose vertices are not given are left out
+        @params vertices: Iterable of vertex property maps
+        @params edges: Iterable of edge property maps
+        @params properties: Vertex property keys kept in columns
+        @params edge_properties: Edge property keys kept in columns
+        @params weight: Optional edge property used by weighted
+        shortest paths, missing values counting as 1
+        @params timestamp: Optional property holding the time vertices
+        and edges were last changed, kept in columns of both"""
+        properties = list(properties)
+        edge_properties = list(edge_properties)
+        if timestamp is not None:
+            if timestamp not in properties:
+                properties.append(timestamp)
+            if timestamp not in edge_properties:
+                edge_properties.append(timestamp)
+        self.properties = properties
+        self.edgeProperties = edge_properties
+        self.weight = weight
+        self.timestamp = timestamp
+        # Position of the graph change log the snapshot reflects
+        self.position = None
+        self._build(vertices, edges)
+
+    def _build(self, vertices, edges):
+        properties, weight = self.properties, self.weight
+        edge_properties = self.edgeProperties
+        self.ids = []
+        self.index = {}
+        self.columns = dict((key, []) for key in properties)
+        for vertex in vertices:
+            self.index[vertex['_id']] = len(self.ids)
+            self.ids.append(vertex['_id'])
+            for key, column in self.columns.items():
+                column.append(vertex.get(key))
+
+        self.edgeIds = []
+        self.labels = []
+        self.sources = array('l')
+        self.targets = array('l')
+        self.weights = array('d') if weight is not None else None
+        self.edgeColumns = dict((key, []) for key in edge_properties)
+        labels = {}
+        for edge in edges:
+            source = self.index.get(edge.get('_outV'))
+            target = self.index.get(edge.get('_inV'))
+            if source is None or target is None:
+                continue
+            self.edgeIds.append(edge['_id'])
+            label = edge.get('_label')
+            self.labels.append(labels.setdefault(label, label))
+            self.sources.append(source)
+            self.targets.append(target)
+            if self.weights is not None:
+                value = edge.get(weight)
+                self.weights.append(1.0 if value is None else float(value))
+            for key, column in self.edgeColumns.items():
+                column.append(edge.get(key))
+
+        size = len(self.ids)
+        self.outOffsets, self.outTargets, self.outEdges = \
+            _csr(size, self.sources, self.targets)
+        self.inOffsets, self.inTargets, self.inEdges = \
+            _csr(size, self.targets, self.sources)
+        self._edges = None
+        self._since()
+
+    def _since(self):
+        self.since = None
+        if self.timestamp is not None:
+            stamps = [stamp for stamp in self.columns[self.timestamp] +
+                      self.edgeColumns[self.timestamp] if stamp is not None]
+            self.since = max(stamps) if stamps else None
+
+    def _vertexMaps(self):
+        for index, _id in enumerate(self.ids):
+            properties = {'_id': _id}
+            for key, column in self.columns.items():
+                if column[index] is not None:
+                    properties[key] = column[index]
+            yield properties
+
+    def _edgeMaps(self):
+        for edge, _id in enumerate(self.edgeIds):
+            properties = {'_id': _id, '_label': self.labels[edge],
+                          '_outV': self.ids[self.sources[edge]],
+                          '_inV': self.ids[self.targets[edge]]}
+            if self.weights is not None:
+                properties[self.weight] = self.weights[edge]
+            for key, column in self.edgeColumns.items():
+                if column[edge] is not None:
+                    properties[key] = column[edge]
+            yield properties
+
+    def _locate(self, kind, _id):
+        """Returns the index of a vertex or edge id, None if it is not
+        in the snapshot"""
+        if kind == 'vertex':
+            index = self.index
+        else:
+            if self._edges is None:
+                self._edges = dict((edge_id, edge) for edge, edge_id
+                                   in enumerate(self.edgeIds))
+            index = self._edges
+        position = index.get(_id)
+        if position is None:
+            position = index.get(unicode(_id))
+        return position
+
+    def _structural(self, operation, kind, _id, data):
+        """Whether a change adds, removes or moves an element, which
+        the arrays cannot take in place"""
+        if operation not in ('put', 'unset', 'remove'):
+            raise RexsterException("Unknown change %s" % operation)
+        if operation == 'remove':
+            return True
+        position = self._locate(kind, _id)
+        if position is None:
+            return operation == 'put'
+        if kind == 'edge' and operation == 'put':
+            for key, ids in (('_outV', self.sources),
+                             ('_inV', self.targets)):
+                if key in data and unicode(data[key]) != \
+                        unicode(self.ids[ids[position]]):
+                    return True
+        return False
+
+    def _update(self, operation, kind, _id, data):
+        """Applies a property change to an element in place
+
+        @returns Whether the timestamp column lost a value"""
+        position = self._locate(kind, _id)
+        if position is None:
+            return False
+        columns = self.columns if kind == 'vertex' else self.edgeColumns
+        weighted = kind == 'edge' and self.weights is not None
+        if operation == 'unset':
+            for key in data:
+                if key in columns:
+                    columns[key][position] = None
+                if weighted and key == self.weight:
+                    self.weights[position] = 1.0
+            return self.timestamp in data
+        for key, value in data.items():
+            if key in columns:
+                columns[key][position] = value
+            if weighted and key == self.weight:
+                self.weights[position] = 1.0 if value is None \
+                    else float(value)
+        if kind == 'edge' and '_label' in data:
+            self.labels[position] = data['_label']
+        stamp = data.get(self.timestamp) if self.timestamp else None
+        if stamp is not None and (self.since is None or stamp > self.since):
+            self.since = stamp
+        return self.timestamp in data and stamp is None
+
+    def apply(self, changes):
+        """Applies changes to the snapshot. Property changes of its
+        elements are written to the columns in place, while adding or
+        removing elements rebuilds the arrays, which takes no request
+        but time linear in its size. Edges of removed vertices are
+        removed with them
+        @params changes: Iterable of (operation, kind, id, data) tuples
+        as recorded by rexster.ChangeLog: ('put', kind, id, properties)
+        creates or updates an element, ('unset', kind, id, keys)
+        removes properties and ('remove', kind, id, None) an element"""
+        changes = list(changes)
+        if not changes:
+            return
+        if not any(self._structural(*change) for change in changes):
+            lost = False
+            for change in changes:
+                lost = self._update(*change) or lost
+            if lost:
+                self._since()
+            return
+        vertices = OrderedDict((properties['_id'], properties)
+                               for properties in self._vertexMaps())
+        edges = OrderedDict((properties['_id'], properties)
+                            for properties in self._edgeMaps())
+        for operation, kind, _id, data in changes:
+            elements = vertices if kind == 'vertex' else edges
+            if _id not in elements and unicode(_id) in elements:
+                _id = unicode(_id)
+            if operation == 'put':
+                elements.setdefault(_id, {'_id': _id}).update(data)
+            elif operation == 'unset':
+                for key in data:
+                    elements.get(_id, {}).pop(key, None)
+            elif operation == 'remove':
+                elements.pop(_id, None)
+            else:
+                raise RexsterException("Unknown change %s" % operation)
+        self._build(vertices.values(), edges.values())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def countEdges(self):
+        """Returns the number of edges of the snapshot"""
+        return len(self.edgeIds)
+
+    def _vertex(self, _id):
+        index = self.index.get(_id)
+        if index is None:
+            index = self.index.get(unicode(_id))
+        if index is None:
+            raise RexsterException("Vertex %s is not in the snapshot" % _id)
+        return index
+
+    def _adjacent(self, index, direction, label=None):
+        """Yields the (vertex index, edge index) pairs adjacent to a
+        vertex index in the given direction"""
+        if direction not in DIRECTIONS:
+            raise RexsterException("Unknown direction %s" % direction)
+        csrs = []
+        if direction in ('out', 'both'):
+            csrs.append((self.outOffsets, self.outTargets, self.outEdges))
+        if direction in ('in', 'both'):
+            csrs.append((self.inOffsets, self.inTargets, self.inEdges))
+        for offsets, targets, edges in csrs:
+            for position in range(offsets[index], offsets[index + 1]):
+                if label is None or self.labels[edges[position]] == label:
+                    yield targets[position], edges[position]
+
+    def edge(self, edge):
+        """Returns the EdgeTuple of an edge index"""
+        return EdgeTuple(self.edgeIds[edge], self.labels[edge],
+                         self.ids[self.sources[edge]],
+                         self.ids[self.targets[edge]])
+
+    def getProperty(self, _id, key):
+        """Returns a vertex property kept in the snapshot columns
+        @params _id: The vertex id
+        @params key: One of the vertex property keys of the snapshot"""
+        column = self.columns.get(key)
+        if column is None:
+            raise RexsterException("Property %s is not in the snapshot"
+                                   % key)
+        return column[self._vertex(_id)]
+
+    def degree(self, _id, direction='both', label=None):
+        """Returns the number of edges of a vertex
+        @params _id: The vertex id
+        @params direction: 'out', 'in' or 'both'
+        @params label: Optional edge label to filter by"""
+        index = self._vertex(_id)
+        if label is None and direction != 'both':
+            offsets = self.outOffsets if direction == 'out' \
+                else self.inOffsets
+            return offsets[index + 1] - offsets[index]
+        return sum(1 for item in self._adjacent(index, direction, label))
+
+    def neighbours(self, _id, direction='both', label=None):
+        """Returns the ids of the vertices adjacent to a vertex, once
+        per edge
+        @params _id: The vertex id
+        @params direction: 'out', 'in' or 'both'
+        @params label: Optional edge label to filter by"""
+        return [self.ids[target] for target, edge
+                in self._adjacent(self._vertex(_id), direction, label)]
+
+    def bfs(self, start, direction='out', depth=None, label=None):
+        """Walks the graph breadth first from a vertex
+        @params start: The id of the start vertex
+        @params direction: 'out', 'in' or 'both'
+        @params depth: Optional maximum number of hops
+        @params label: Optional edge label to filter by
+
+        @returns The list of (vertex id, hops) pairs in visiting
+        order, starting with (start, 0)"""
+        origin = self._vertex(start)
+        hops = {origin: 0}
+        queue = deque([origin])
+        visited = []
+        while queue:
+            index = queue.popleft()
+            visited.append((self.ids[index], hops[index]))
+            if depth is not None and hops[index] >= depth:
+                continue
+            for target, edge in self._adjacent(index, direction, label):
+                if target not in hops:
+                    hops[target] = hops[index] + 1
+                    queue.append(target)
+        return visited
+
+    def kHop(self, start, k, direction='both', label=None):
+        """Returns the ids of the vertices at most k hops away from a
+        vertex, the vertex itself excluded"""
+        return set(_id for _id, hops
+                   in self.bfs(start, direction, k, label)[1:])
+
+    def shortestPath(self, start, end, direction='out', weighted=False,
+                     label=None):
+        """Finds a shortest path between two vertices, by number of
+        edges or, if weighted, by total weight with Dijkstra
+        @params start: The id of the start vertex
+        @params end: The id of the end vertex
+        @params direction: 'out', 'in' or 'both'
+        @params weighted: Whether to sum the snapshot weights
+        @params label: Optional edge label to filter by
+
+        @returns The list of EdgeTuple objects of the path, None when
+        the end cannot be reached"""
+        if weighted and self.weights is None:
+            raise RexsterException("The snapshot was taken without weight")
+        origin, goal = self._vertex(start), self._vertex(end)
+        previous = {origin: None}
+        if weighted:
+            distances = {origin: 0.0}
+            heap = [(0.0, origin)]
+            done = set()
+            while heap:
+                distance, index = heapq.heappop(heap)
+                if index in done:
+                    continue
+                done.add(index)
+                if index == goal:
+                    break
+                for target, edge in self._adjacent(index, direction, label):
+                    candidate = distance + self.weights[edge]
+                    if candidate < distances.get(target, float('inf')):
+                        distances[target] = candidate
+                        previous[target] = (index, edge)
+                        heapq.heappush(heap, (candidate, target))
+        else:
+            queue = deque([origin])
+            while queue and goal not in previous:
+                index = queue.popleft()
+                for target, edge in self._adjacent(index, direction, label):
+                    if target not in previous:
+                        previous[target] = (index, edge)
+                        queue.append(target)
+        if goal not in previous:
+            return None
+        path = []
+        index = goal
+        while previous[index] is not None:
+            index, edge = previous[index]
+            path.append(self.edge(edge))
+        path.reverse()
+        return path
@@ -0,0 +1,654 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+"""An in-process stand-in for a Rexster server.
+
+FakeRexsterServer serves the subset of the Rexster REST API used by
+this client over in-memory graphs, with a configurable latency per
+request, so the client can be tested and benchmarked offline:
+
+>>> fake = FakeRexsterServer(latency=0.001)
+>>> fake.generate('benchgraph', vertices=10000, edges=50000)
+>>> fake.start()
+>>> server = RexsterServer(fake.url)
+>>> fake.stop()
+
+Gremlin cannot be evaluated, so /tp/gremlin answers the scripts of
+rexster.SCRIPTS, plus any script added with registerScript, by running
+an equivalent Python function over the graph.
+"""
+
+import BaseHTTPServer
+import SocketServer
+import random
+import socket
+import threading
+import time
+import urlparse
+from collections import OrderedDict
+
+import simplejson
+
+from rexster import SCRIPTS
+
+SERVER_NAME = u'Rexster: A RESTful Graph Shell'
+DEFAULT_GRAPHS = (u'tinkergraph', u'gratefulgraph', u'tinkergraph-readonly',
+                  u'sailgraph', u'emptygraph')
+
+
+class FakeRexsterError(Exception):
+
+    def __init__(self, status, message):
+        super(FakeRexsterError, self).__init__(message)
+        self.status = status
+
+
+class FakeGraph(object):
+    """An in-memory property graph with string ids"""
+
+    def __init__(self, name):
+        self.name = name
+        self.vertices = {}
+        self.edges = {}
+        self.outE = {}
+        self.inE = {}
+        self.indices = {}
+        self.keyIndices = {'vertex': set(), 'edge': set()}
+        self._lock = threading.RLock()
+        self._nextId = 1
+
+    def _newId(self, _id=None):
+        if _id is None or _id == '':
+            while unicode(self._nextId) in self.vertices or \
+                    unicode(self._nextId) in self.edges:
+                self._nextId += 1
+            _id = self._nextId
+        return unicode(_id)
+
+    def addVertex(self, _id=None, properties=None):
+        with self._lock:
+            _id = self._newId(_id)
+            if _id in self.vertices:
+                raise FakeRexsterError(409, "Vertex %s already exists" % _id)
+            vertex = OrderedDict([('_id', _id), ('_type', 'vertex')])
+            vertex.update(properties or {})
+            self.vertices[_id] = vertex
+            self.outE[_id] = []
+            self.inE[_id] = []
+            return vertex
+
+    def addEdge(self, outV, inV, label, properties=None, _id=None):
+        with self._lock:
+            outV, inV = unicode(outV), unicode(inV)
+            if outV not in self.vertices or inV not in self.vertices:
+                raise FakeRexsterError(400, "Edge vertices not found")
+            _id = self._newId(_id)
+            edge = OrderedDict([('_id', _id), ('_type', 'edge'),
+                                ('_outV', outV), ('_inV', inV),
+                                ('_label', label)])
+            edge.update(properties or {})
+            self.edges[_id] = edge
+            self.outE[outV].append(_id)
+            self.inE[inV].append(_id)
+            return edge
+
+    def element(self, kind, _id):
+        elements = self.vertices if kind == 'vertex' else self.edges
+        element = elements.get(unicode(_id))
+        if element is None:
+            raise FakeRexsterError(404, "%s with id %s cannot be found"
+                                   % (kind.capitalize(), _id))
+        return element
+
+    def removeVertex(self, _id):
+        with self._lock:
+            vertex = self.element('vertex', _id)
+            for edgeId in self.outE[vertex['_id']] + self.inE[vertex['_id']]:
+                if edgeId in self.edges:
+                    self.removeEdge(edgeId)
+            del self.vertices[vertex['_id']]
+            del self.outE[vertex['_id']]
+            del self.inE[vertex['_id']]
+            self._unindex(vertex)
+
+    def removeEdge(self, _id):
+        with self._lock:
+            edge = self.element('edge', _id)
+            del self.edges[edge['_id']]
+            self.outE[edge['_outV']].remove(edge['_id'])
+            self.inE[edge['_inV']].remove(edge['_id'])
+            self._unindex(edge)
+
+    def createIndex(self, name, indexClass, indexType='manual'):
+        with self._lock:
+            if name in self.indices:
+                raise FakeRexsterError(409, "Index %s already exists" % name)
+            self.indices[name] = {'class': indexClass, 'type': indexType,
+                                  'entries': {}}
+            return self.indices[name]
+
+    def putIndex(self, name, key, value, kind, _id):
+        with self._lock:
+            entry = (kind, unicode(_id))
+            self.element(*entry)
+            ids = self.indices[name]['entries'].setdefault((key, value), [])
+            if entry not in ids:
+                ids.append(entry)
+
+    def removeIndex(self, name, key, value, kind, _id):
+        with self._lock:
+            entry = (kind, unicode(_id))
+            ids = self.indices[name]['entries'].get((key, value), [])
+            if entry in ids:
+                ids.remove(entry)
+
+    def lookupIndex(self, name, key, value):
+        ids = self.indices[name]['entries'].get((key, value), [])
+        return [self.element(kind, _id) for kind, _id in ids]
+
+    def _unindex(self, element):
+        entry = (element['_type'], element['_id'])
+        for index in self.indices.values():
+            for ids in index['entries'].values():
+                if entry in ids:
+                    ids.remove(entry)
+
+    def adjacentEdges(self, vertexId, direction, labels=None):
+        vertex = self.element('vertex', vertexId)
+        ids = []
+        if direction in ('out', 'both'):
+            ids.extend(self.outE[vertex['_id']])
+        if direction in ('in', 'both'):
+            ids.extend(self.inE[vertex['_id']])
+        edges = [self.edges[_id] for _id in ids]
+        if labels:
+            edges = [e for e in edges if e['_label'] in labels]
+        return edges
+
+    def adjacentVertices(self, vertexId, direction, labels=None):
+        vertexId = unicode(vertexId)
+        vertices = []
+        for edge in self.adjacentEdges(vertexId, direction, labels):
+            if edge['_outV'] == vertexId and direction != 'in':
+                vertices.append(self.vertices[edge['_inV']])
+            if edge['_inV'] == vertexId and direction != 'out':
+                vertices.append(self.vertices[edge['_outV']])
+        return vertices
+
+
+def tinkergraph(name='tinkergraph'):
+    """Returns the classic TinkerPop toy graph"""
+    graph = FakeGraph(name)
+    for _id, properties in [(1, [('name', 'marko'), ('age', 29)]),
+                            (2, [('name', 'vadas'), ('age', 27)]),
+                            (3, [('name', 'lop'), ('lang', 'java')]),
+                            (4, [('name', 'josh'), ('age', 32)]),
+                            (5, [('name', 'ripple'), ('lang', 'java')]),
+                            (6, [('name', 'peter'), ('age', 35)])]:
+        graph.addVertex(_id, properties)
+    for _id, outV, inV, label, weight in [(7, 1, 2, 'knows', 0.5),
+                                          (8, 1, 4, 'knows', 1.0),
+                                          (9, 1, 3, 'created', 0.4),
+                                          (10, 4, 5, 'created', 1.0),
+                                          (11, 4, 3, 'created', 0.4),
+                                          (12, 6, 3, 'created', 0.2)]:
+        graph.addEdge(outV, inV, label, {'weight': weight}, _id)
+    return graph
+
+
+def _resolve(graph, created, ref):
+    if ref[0] == 'new':
+        return created[ref[1]]
+    return graph.element(ref[0], ref[1])
+
+
+def _batch(graph, params):
+    created = []
+    for op in params['ops']:
+        if op[0] == 'vertex':
+            created.append(graph.addVertex(op[1], op[2]))
+        elif op[0] == 'edge':
+            outV = _resolve(graph, created, op[2])
+            inV = _resolve(graph, created, op[3])
+            created.append(graph.addEdge(outV['_id'], inV['_id'], op[4],
+                                         op[5], op[1]))
+        else:
+            _resolve(graph, created, op[1])[op[2]] = op[3]
+    return [element['_id'] for element in created]
+
+
+def _shortestPath(graph, params):
+    start, end = unicode(params['start']), unicode(params['end'])
+    previous = {start: None}
+    frontier = [start]
+    while frontier and end not in previous:
+        following = []
+        for vertexId in frontier:
+            for edge in graph.adjacentEdges(vertexId, 'both'):
+                other = edge['_inV'] if edge['_outV'] == vertexId \
+                    else edge['_outV']
+                if other not in previous:
+                    previous[other] = edge
+                    following.append(other)
+        frontier = following
+    path = []
+    vertexId = end
+    while previous.get(vertexId) is not None:
+        edge = previous[vertexId]
+        path.append(edge)
+        vertexId = edge['_inV'] if edge['_outV'] == vertexId \
+            else edge['_outV']
+    return list(reversed(path))
+
+
+def _indexPut(graph, params):
+    for key, value, kind, _id in params['entries']:
+        graph.putIndex(params['name'], key, value, kind, _id)
+    return len(params['entries'])
+
+
+def _indexRemove(graph, params):
+    for key, value, kind, _id in params['entries']:
+        graph.removeIndex(params['name'], key, value, kind, _id)
+    return len(params['entries'])
+
+
+def _indexGet(graph, params):
+    return [graph.lookupIndex(params['name'], key, value)
+            for key, value in params['pairs']]
+
+
+def _groupCount(kind):
+    def handler(graph, params):
+        elements = graph.vertices if kind == 'vertex' else graph.edges
+        counts = {}
+        for element in elements.values():
+            value = element.get(params['key'])
+            counts[value] = counts.get(value, 0) + 1
+        return [[value, count] for value, count in counts.items()]
+    return handler
+
+
+def _changed(kind):
+    def handler(graph, params):
+        elements = graph.vertices if kind == 'vertex' else graph.edges
+        key, since = params['key'], params['since']
+        return [element for element in elements.values()
+                if element.get(key) is not None and element[key] >= since]
+    return handler
+
+
+def _getMany(kind):
+    def handler(graph, params):
+        elements = graph.vertices if kind == 'vertex' else graph.edges
+        return [elements.get(unicode(_id)) for _id in params['ids']]
+    return handler
+
+
+# Python equivalents of the Gremlin scripts in rexster.SCRIPTS
+GREMLIN_HANDLERS = {
+    'vertices': _getMany('vertex'),
+    'edges': _getMany('edge'),
+    'shortest_path': _shortestPath,
+    'batch': _batch,
+    'count_vertices': lambda graph, params: [len(graph.vertices)],
+    'count_edges': lambda graph, params: [len(graph.edges)],
+    'group_count_vertices': _groupCount('vertex'),
+    'group_count_edges': _groupCount('edge'),
+    'changed_vertices': _changed('vertex'),
+    'changed_edges': _changed('edge'),
+    'index_put': _indexPut,
+    'index_remove': _indexRemove,
+    'index_get': _indexGet,
+}
+
+
+def _returnKeys(params, data):
+    """Returns the rexster.returnKeys of a request, or None"""
+    if 'rexster.returnKeys' in params:
+        return params['rexster.returnKeys'].strip('[]').split(',')
+    options = data.get('rexster')
+    if isinstance(options, dict):
+        return options.get('returnKeys')
+    return None
+
+
+def _project(value, keys):
+    """Copies the elements of a result keeping only the given keys"""
+    if isinstance(value, list):
+        return [_project(item, keys) for item in value]
+    if isinstance(value, dict) and '_type' in value:
+        return OrderedDict((k, v) for k, v in value.items()
+                           if k.startswith('_') or k in keys)
+    return value
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method):
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        url = urlparse.urlsplit(self.path)
+        params = dict((k, v[-1]) for k, v in
+                      urlparse.parse_qs(url.query, True).items())
+        length = int(self.headers.get('content-length') or 0)
+        body = self.rfile.read(length) if length else ''
+        data = {}
+        if body:
+            if 'json' in (self.headers.get('content-type') or ''):
+                data = simplejson.loads(body)
+            else:
+                data = dict((k, v[-1]) for k, v in
+                            urlparse.parse_qs(body, True).items())
+        segments = [s for s in url.path.split('/') if s]
+        if segments and segments[0] == 'graphs':
+            segments = segments[1:]
+        try:
+            with fake._lock:
+                fake.requests += 1
+            status, content = fake._route(method, segments, params, data)
+            keys = _returnKeys(params, data)
+            if keys is not None and 'results' in content:
+                content['results'] = _project(content['results'], keys)
+        except FakeRexsterError as e:
+            status, content = e.status, {'message': unicode(e)}
+        payload = simplejson.dumps(content)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class _HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def process_request(self, request, client_address):
+        thread = threading.Thread(target=self.process_request_thread,
+                                  args=(request, client_address))
+        thread.daemon = True
+        with self.fake._lock:
+            self.fake._sockets.add(request)
+            self.fake._threads.add(thread)
+        thread.start()
+
+    def shutdown_request(self, request):
+        with self.fake._lock:
+            self.fake._sockets.discard(request)
+            self.fake._threads.discard(threading.current_thread())
+        BaseHTTPServer.HTTPServer.shutdown_request(self, request)
+
+
+class FakeRexsterServer(object):
+    """An HTTP server imitating Rexster, running in a background
+    thread of the current process"""
+
+    def __init__(self, graphs=DEFAULT_GRAPHS, latency=0.0, gremlin=True,
+                 host='127.0.0.1', port=0):
+        """Creates a new server, serving the toy TinkerPop graph as
+        'tinkergraph' and empty graphs for the other names
+        @params graphs: Names of the graphs served
+        @params latency: Seconds waited before answering each request
+        @params gremlin: Whether the Gremlin extension is available
+        @params host, port: Address to listen on, port 0 picks a free one"""
+        self.latency = latency
+        self.gremlin = gremlin
+        self.requests = 0
+        self.graphs = OrderedDict()
+        for name in graphs:
+            if name == 'tinkergraph':
+                self.graphs[name] = tinkergraph(name)
+            else:
+                self.graphs[name] = FakeGraph(name)
+        self.scripts = dict((SCRIPTS[name].source, handler)
+                            for name, handler in GREMLIN_HANDLERS.items())
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._sockets = set()
+        self._threads = set()
+        self._address = (host, port)
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """The URL to give to RexsterServer"""
+        host, port = self._httpd.server_address[:2]
+        return 'http://%s:%s/graphs' % (host, port)
+
+    def start(self):
+        self._httpd = _HTTPServer(self._address, _Handler)
+        self._httpd.fake = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        with self._lock:
+            sockets, self._sockets = list(self._sockets), set()
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        # Handlers still running at interpreter exit fail noisily
+        with self._lock:
+            threads, self._threads = list(self._threads), set()
+        for thread in threads:
+            thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def generate(self, name, vertices=1000, edges=5000, labels=('knows',),
+                 seed=0):
+        """Serves a new graph of random vertices and edges. Vertex i
+        has the properties name ('v<i>') and group (i % 10)
+        @params name: The graph name
+        @params vertices: Number of vertices
+        @params edges: Number of edges
+        @params labels: Labels chosen for the edges
+        @params seed: Seed of the random generator
+
+        @returns The FakeGraph"""
+        rand = random.Random(seed)
+        graph = FakeGraph(name)
+        for i in range(1, vertices + 1):
+            graph.addVertex(i, {'name': 'v%d' % i, 'group': i % 10})
+        for i in range(edges):
+            graph.addEdge(rand.randint(1, vertices),
+                          rand.randint(1, vertices), rand.choice(labels),
+                          {'weight': rand.random()}, vertices + i + 1)
+        self.graphs[name] = graph
+        return graph
+
+    def registerScript(self, source, handler):
+        """Answers a Gremlin script with a Python function
+        @params source: The exact script source sent by the client
+        @params handler: Callable receiving the FakeGraph and the dict
+        of bound parameters and returning the results"""
+        self.scripts[source] = handler
+
+    def _route(self, method, segments, params, data):
+        if not segments:
+            return 200, {'name': SERVER_NAME,
+                         'version': '0.5',
+                         'upTime': '%.0f' % (time.time() - self.started),
+                         'graphs': list(self.graphs)}
+        graph = self.graphs.get(segments[0])
+        if graph is None:
+            raise FakeRexsterError(404, "Graph %s cannot be found"
+                                   % segments[0])
+        rest = segments[1:]
+        with graph._lock:
+            if not rest:
+                return 200, {'name': graph.name, 'graph': 'fakegraph',
+                             'version': '0.5'}
+            if rest[0] in ('vertices', 'edges'):
+                return self._elements(graph, method, rest, params, data)
+            if rest[0] == 'indices':
+                return self._indices(graph, method, rest, params, data)
+            if rest[0] == 'keyindices' and method == 'POST' \
+                    and len(rest) == 3:
+                graph.keyIndices[rest[1]].add(rest[2])
+                return 200, {}
+            if rest == ['tp', 'gremlin'] and self.gremlin:
+                return self._gremlin(graph, data or params)
+        raise FakeRexsterError(404, "Unknown resource %s"
+                               % '/'.join(segments))
+
+    def _listing(self, elements, params):
+        start = int(params.get('rexster.offset.start', 0))
+        end = params.get('rexster.offset.end')
+        end = int(end) if end is not None else None
+        results = elements[start:end]
+        return 200, {'results': results, 'totalSize': len(results)}
+
+    def _elements(self, graph, method, rest, params, data):
+        kind = 'vertex' if rest[0] == 'vertices' else 'edge'
+        elements = graph.vertices if kind == 'vertex' else graph.edges
+        if len(rest) == 1:
+            if method == 'GET':
+                return self._listing(list(elements.values()), params)
+            if method == 'POST':
+                return 200, {'results': self._create(graph, kind, None,
+                                                     params, data)}
+        elif len(rest) == 2:
+            _id = rest[1]
+            if method == 'GET':
+                return 200, {'results': graph.element(kind, _id)}
+            if method == 'POST':
+                if unicode(_id) not in elements:
+                    return 200, {'results': self._create(graph, kind, _id,
+                                                         params, data)}
+                element = graph.element(kind, _id)
+                element.update(self._properties(data))
+                element.update(self._properties(params))
+                return 200, {'results': element}
+            if method == 'PUT':
+                element = graph.element(kind, _id)
+                for key in list(element):
+                    if not key.startswith('_'):
+                        del element[key]
+                element.update(self._properties(data))
+                return 200, {'results': element}
+            if method == 'DELETE':
+                keys = list(self._properties(params))
+                if keys:
+                    element = graph.element(kind, _id)
+                    for key in keys:
+                        element.pop(key, None)
+                elif kind == 'vertex':
+                    graph.removeVertex(_id)
+                else:
+                    graph.removeEdge(_id)
+                return 200, {}
+        elif len(rest) == 3 and kind == 'vertex' and method == 'GET':
+            return self._adjacent(graph, rest[1], rest[2], params)
+        raise FakeRexsterError(404, "Unknown resource")
+
+    def _properties(self, data):
+        return dict((k, v) for k, v in data.items()
+                    if not k.startswith('_') and not k.startswith('rexster.'))
+
+    def _create(self, graph, kind, _id, params, data):
+        properties = dict(params)
+        properties.update(data)
+        if kind == 'vertex':
+            return graph.addVertex(_id, self._properties(properties))
+        return graph.addEdge(properties.get('_outV'),
+                             properties.get('_inV'),
+                             properties.get('_label'),
+                             self._properties(properties), _id)
+
+    def _adjacent(self, graph, _id, resource, params):
+        labels = None
+        if params.get('_label'):
+            labels = [params['_label']]
+        if resource in ('outE', 'inE', 'bothE'):
+            results = graph.adjacentEdges(_id, resource[:-1], labels)
+        elif resource in ('out', 'in', 'both'):
+            results = graph.adjacentVertices(_id, resource, labels)
+        elif resource in ('outCount', 'inCount', 'bothCount'):
+            edges = graph.adjacentEdges(_id, resource[:-5], labels)
+            return 200, {'totalSize': len(edges)}
+        else:
+            raise FakeRexsterError(404, "Unknown resource %s" % resource)
+        return self._listing(results, params)
+
+    def _indices(self, graph, method, rest, params, data):
+        if len(rest) == 1 and method == 'GET':
+            results = [self._indexInfo(name, index)
+                       for name, index in graph.indices.items()]
+            return 200, {'results': results, 'totalSize': len(results)}
+        name = rest[1]
+        index = graph.indices.get(name)
+        if method == 'POST' and 'key' not in data and len(rest) == 2:
+            index = graph.createIndex(name, data.get('class'),
+                                      data.get('type', 'manual'))
+            return 200, {'results': self._indexInfo(name, index)}
+        if index is None:
+            raise FakeRexsterError(404, "Index %s cannot be found" % name)
+        if len(rest) == 3 and rest[2] == 'count':
+            ids = index['entries'].get((params.get('key'),
+                                        params.get('value')), [])
+            return 200, {'totalSize': len(ids)}
+        if len(rest) == 3 and rest[2] == 'keys':
+            return 200, {'results': sorted(set(key for key, value
+                                               in index['entries']))}
+        if method == 'GET' and 'key' not in params:
+            return 200, {'results': self._indexInfo(name, index)}
+        if method == 'GET':
+            results = graph.lookupIndex(name, params['key'], params['value'])
+            return self._listing(results, params)
+        if method == 'POST':
+            graph.putIndex(name, data['key'], data['value'], data['class'],
+                           data['id'])
+            return 200, {}
+        if method == 'DELETE' and 'key' in params:
+            graph.removeIndex(name, params['key'], params['value'],
+                              params['class'], params['id'])
+            return 200, {}
+        if method == 'DELETE':
+            del graph.indices[name]
+            return 200, {}
+        raise FakeRexsterError(404, "Unknown resource")
+
+    def _indexInfo(self, name, index):
+        return {'name': name, 'class': index['class'], 'type': index['type']}
+
+    def _gremlin(self, graph, data):
+        handler = self.scripts.get(data.get('script'))
+        if handler is None:
+            raise FakeRexsterError(500, "Unsupported script: %s"
+                                   % data.get('script'))
+        results = handler(graph, data.get('params') or {})
+        return 200, {'results': results, 'success': True}
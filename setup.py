@@ -49,4 +49,8 @@ setup(
         'requests',
         'simplejson',
     ],
+    extras_require={
+        'green': ['gevent'],
+        'streaming': ['ijson'],
+    },
 )